@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, connections, router, transaction, IntegrityError
+from django.db.models import Max
 from application.apps import ApplicationConfig
 from awesome.helper import helper_datetime
 
@@ -31,15 +32,134 @@ class AppGlobalId(models.Model):
         ret_obj = AppGlobalId.objects.create(**params)
         return int(ret_obj.uid)
 
+    @classmethod
+    def create_uids(cls, count):
+        """
+        批量生成UID，一条多行 INSERT
+        :return: list
+        """
+        db_name = router.db_for_write(cls)
+        now = helper_datetime.now()
+        objs = [AppGlobalId(create_time=now) for _ in range(count)]
+        with transaction.atomic(using=db_name):
+            objs = AppGlobalId.objects.using(db_name).bulk_create(objs)
+            if not objs or objs[0].uid is not None:
+                return [int(obj.uid) for obj in objs]
+            uids = cls.inserted_uids(db_name, count)
+            if uids is None:
+                # 回滚本次写入
+                transaction.set_rollback(True, using=db_name)
+        if uids is None:
+            return [cls.create_uid() for _ in range(count)]
+        return uids
+
+    @classmethod
+    def inserted_uids(cls, db_name, count):
+        """
+        MySQL 不返回多行 INSERT 的自增ID，按 LAST_INSERT_ID() 推算
+        多行 VALUES 属于 simple insert，一次分配 count 个自增ID，
+        LAST_INSERT_ID() 为第一行的ID，之后每行加 @@auto_increment_increment (多主复制时不为 1)
+        推算的ID不全在表中时(不应出现)，返回 None，由 create_uids 回滚后逐行写入
+        :return: list
+        """
+        table = connections[db_name].ops.quote_name(cls._meta.db_table)
+        with connections[db_name].cursor() as cursor:
+            cursor.execute('SELECT LAST_INSERT_ID(), @@auto_increment_increment')
+            first_uid, increment = map(int, cursor.fetchone())
+            uids = list(range(first_uid, first_uid + count * increment, increment))
+            cursor.execute('SELECT COUNT(*) FROM %s WHERE uid IN (%s)' % (table, ','.join(map(str, uids))))
+            found = int(cursor.fetchone()[0])
+        if found != count:
+            return None
+        return uids
+
     @classmethod
     def get_new_uid(cls):
         """
-        获取UID，递归处理 过滤的UID
+        获取UID，跳过 过滤的UID
+        分配方式由 settings.UID_BACKEND 指定：
+        segment 数据库号段， redis Redis号段， insert 每个UID写入一行
+        :return:
+        """
+        from application.app_models.models_uidsegment import get_uid_allocator, get_expect_index
+        return get_uid_allocator().get_new_uid(get_expect_index())
+
+    @classmethod
+    def get_new_uids(cls, count):
+        """
+        批量获取UID，跳过 过滤的UID
+        segment/redis 一次预留一个足够长的号段，insert 一条多行 INSERT
+        :param count: UID数量
+        :return: list
+        """
+        from application.app_models.models_uidsegment import get_uid_allocator, get_expect_index
+        count = int(count)
+        if count <= 0:
+            return list()
+        return get_uid_allocator().get_new_uids(count, get_expect_index())
+
+    @classmethod
+    def create_uid_byid(cls, uid):
+        """
+        写入指定的UID，自增ID随之跳到 uid 之后
+        UID 已存在时返回 None
+        :return:
+        """
+        params = dict(uid=uid, create_time=helper_datetime.now())
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                AppGlobalId.objects.create(**params)
+        except IntegrityError:
+            return None
+        return int(uid)
+
+    @classmethod
+    def raise_auto_increment(cls):
+        """
+        自增ID跳到号段(segment/redis)已分配的最大UID之后
+        写入一行 uid 为号段最大ID的占位行，MySQL 和 SQLite 的自增值随之跳到其后
+        :return: 自增ID的起点是否有变化
+        """
+        from application.app_models.models_uidsegment import AppUidSegment
+        max_segment = AppUidSegment.objects.aggregate(max_id=Max('max_id'))['max_id'] or 0
+        max_uid = cls.objects.aggregate(max_uid=Max('uid'))['max_uid'] or 0
+        if max_segment <= max_uid:
+            return False
+        cls.create_uid_byid(max_segment)
+        return True
+
+    @classmethod
+    def get_new_uid_by_insert(cls, expect_index=None):
+        """
+        获取UID，每个UID写入一行
+        自增ID落在 过滤的UID/区间 中时，直接写入区间之后的第一个ID，不逐个写入被过滤的ID
+        :param expect_index: IntervalIndex
         :return:
         """
-        from application.apps import ApplicationConfig
-        expect_uid_list = ApplicationConfig.EXPECT_ID_LIST
         uid = cls.create_uid()
-        if uid not in expect_uid_list:
-            return uid
-        return cls.get_new_uid()
+        while expect_index and uid in expect_index:
+            # 并发时该ID可能已被其他进程的自增占用，重新取
+            uid = cls.create_uid_byid(expect_index.next_free(uid)) or cls.create_uid()
+        return uid
+
+    @classmethod
+    def get_new_uids_by_insert(cls, count, expect_index=None):
+        """
+        批量获取UID，多行 INSERT，过滤掉的UID再补写
+        :param count: UID数量
+        :param expect_index: IntervalIndex
+        :return: list
+        """
+        uids = list()
+        while len(uids) < count:
+            new_uids = cls.create_uids(count - len(uids))
+            if expect_index:
+                last_uid = new_uids[-1]
+                new_uids = [uid for uid in new_uids if uid not in expect_index]
+                if last_uid in expect_index:
+                    # 自增ID停在过滤区间中，直接跳到区间之后
+                    uid = cls.create_uid_byid(expect_index.next_free(last_uid))
+                    if uid:
+                        new_uids.append(uid)
+            uids.extend(new_uids[:count - len(uids)])
+        return uids
@@ -0,0 +1,319 @@
+import os
+import threading
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from application.apps import ApplicationConfig
+from awesome.helper import helper_datetime
+from awesome.helper.helper_interval import IntervalIndex
+
+# 表前缀
+TABLE_PRE = ApplicationConfig.DB_APP_TABLE_PRE
+# 表所属的APP
+APP_LABEL = ApplicationConfig.DB_APP_LABEL
+
+
+class AppUidSegment(models.Model):
+    """
+    UID 号段
+    每次原子地把 max_id 增加 step，预留 (max_id - step, max_id] 这一段ID，
+    进程在内存中分配，用完再取下一段
+    """
+    biz_tag = models.CharField('业务标识', max_length=32, primary_key=True)
+    max_id = models.BigIntegerField('已分配出去的最大ID', null=False, blank=False)
+    step = models.PositiveIntegerField('号段长度', null=False, blank=False)
+    update_time = models.PositiveIntegerField('更新时间', null=False, blank=False)
+
+    class Meta:
+        managed = True
+        db_table = TABLE_PRE + 'uid_segment'
+        verbose_name = verbose_name_plural = 'UID号段'
+        app_label = APP_LABEL
+
+    @classmethod
+    def init_max_id(cls, exclude=None):
+        """
+        所有分配方式已分配的最大UID， app_global_id 和 所有号段(exclude 除外)的最大值
+        每次预留号段都从这之后开始，切换UID分配方式后，不会分配到已分配的ID
+        切换分配方式需要重启全部进程，不支持多种分配方式同时运行
+        :param exclude: 不计入的 biz_tag
+        :return:
+        """
+        from application.app_models.models_golbaluid import AppGlobalId
+        max_uid = AppGlobalId.objects.aggregate(max_uid=Max('uid'))['max_uid'] or 0
+        segments = cls.objects.all()
+        if exclude:
+            segments = segments.exclude(biz_tag=exclude)
+        max_segment = segments.aggregate(max_id=Max('max_id'))['max_id'] or 0
+        return max(max_uid, max_segment)
+
+    @classmethod
+    def get_max_id(cls, biz_tag):
+        """
+        biz_tag 已分配出去的最大ID，没有记录时为 init_max_id
+        :return:
+        """
+        max_id = cls.objects.filter(biz_tag=biz_tag).values_list('max_id', flat=True).first()
+        if max_id is None:
+            return cls.init_max_id()
+        return max_id
+
+    @classmethod
+    def raise_max_id(cls, biz_tag, max_id, step=0):
+        """
+        只增不减地更新 biz_tag 已分配出去的最大ID
+        :return: 更新后的最大ID
+        """
+        db_name = router.db_for_write(cls)
+        with transaction.atomic(using=db_name):
+            updated = cls.objects.filter(biz_tag=biz_tag).update(
+                max_id=Greatest(F('max_id'), max_id),
+                update_time=helper_datetime.now(),
+            )
+            if not updated:
+                try:
+                    with transaction.atomic(using=db_name):
+                        cls.objects.create(
+                            biz_tag=biz_tag,
+                            max_id=max(max_id, cls.init_max_id()),
+                            step=step,
+                            update_time=helper_datetime.now(),
+                        )
+                except IntegrityError:
+                    cls.objects.filter(biz_tag=biz_tag).update(
+                        max_id=Greatest(F('max_id'), max_id),
+                        update_time=helper_datetime.now(),
+                    )
+            return cls.objects.filter(biz_tag=biz_tag).values_list('max_id', flat=True).get()
+
+    @classmethod
+    def reserve_segment(cls, biz_tag, step):
+        """
+        原子地预留一个号段，号段在所有分配方式已分配的最大UID之后
+        :return: (起始ID, 结束ID)，包含两端
+        """
+        step = max(1, int(step))
+        db_name = router.db_for_write(cls)
+        with transaction.atomic(using=db_name):
+            floor = cls.init_max_id(exclude=biz_tag)
+            # UPDATE 持有行锁，直到事务结束，多个进程之间不会取到同一段
+            updated = cls.objects.filter(biz_tag=biz_tag).update(
+                max_id=Greatest(F('max_id'), floor) + step,
+                step=step,
+                update_time=helper_datetime.now(),
+            )
+            if not updated:
+                try:
+                    with transaction.atomic(using=db_name):
+                        cls.objects.create(
+                            biz_tag=biz_tag,
+                            max_id=floor + step,
+                            step=step,
+                            update_time=helper_datetime.now(),
+                        )
+                except IntegrityError:
+                    # 其他进程已经创建
+                    cls.objects.filter(biz_tag=biz_tag).update(
+                        max_id=Greatest(F('max_id'), floor) + step,
+                        step=step,
+                        update_time=helper_datetime.now(),
+                    )
+            max_id = cls.objects.filter(biz_tag=biz_tag).values_list('max_id', flat=True).get()
+
+        return max_id - step + 1, max_id
+
+
+class UidSegmentAllocator:
+    """
+    号段分配器
+    一次数据库更新预留 step 个ID，之后在进程内存中分配，
+    线程安全， fork 出的子进程会丢弃父进程的号段，重新预留
+    """
+
+    def __init__(self, biz_tag='uid', step=1000):
+        self.biz_tag = biz_tag
+        self.step = step
+        self.lock = threading.Lock()
+        self.pid = None
+        # 下一个可分配的ID，号段的最大ID
+        self.next_id = 0
+        self.max_id = -1
+
+    def next_segment(self, step=None):
+        """
+        预留下一个号段
+        :param step: 号段长度，默认 self.step
+        """
+        self.next_id, self.max_id = AppUidSegment.reserve_segment(self.biz_tag, step or self.step)
+        self.pid = os.getpid()
+
+    def skip_to(self, uid):
+        """
+        下一个号段从不小于 uid 的ID开始，跳过大的过滤区间时不逐段预留
+        """
+        AppUidSegment.raise_max_id(self.biz_tag, uid - 1, self.step)
+
+    def get_new_uid(self, expect_index=None):
+        """
+        获取UID，直接跳过 过滤的UID/区间
+        :param expect_index: IntervalIndex
+        :return:
+        """
+        return self.get_new_uids(1, expect_index)[0]
+
+    def get_new_uids(self, count, expect_index=None):
+        """
+        批量获取UID，直接跳过 过滤的UID/区间
+        号段不够时一次预留剩余需要的数量，通常只需要一次数据库更新
+        :param count: UID数量
+        :param expect_index: IntervalIndex
+        :return: list
+        """
+        uids = list()
+        with self.lock:
+            while len(uids) < count:
+                if self.pid != os.getpid() or self.next_id > self.max_id:
+                    self.next_segment(max(self.step, count - len(uids)))
+                uid = self.next_id
+                if expect_index:
+                    uid = expect_index.next_free(uid)
+                if uid > self.max_id:
+                    # 本号段剩余的ID都被过滤，下一个号段直接从区间之后开始
+                    self.skip_to(uid)
+                    self.next_id = uid
+                    continue
+                self.next_id = uid + 1
+                uids.append(uid)
+        return uids
+
+
+class RedisUidAllocator(UidSegmentAllocator):
+    """
+    Redis 号段分配器
+    INCRBY 原子地预留 step 个ID，之后在进程内存中分配
+    已分配的最大ID 提前 persist_ahead 写入 MySQL 作为高水位，分配的ID不会超过高水位
+    计数器是永久的 key，不设置过期时间
+    Redis 的计数器丢失(重启)时，从 MySQL 的高水位继续，不会重复分配
+    Redis 从旧的快照恢复，计数器低于写入高水位时的值，同样跳到高水位之后；
+    快照晚于最近一次写入高水位时无法发现，最多回退 persist_ahead 以内
+    计数器落后于其他分配方式已分配的ID时(切换分配方式)，先跳过这些ID
+    """
+
+    def __init__(self, obj_redis, biz_tag='uid_redis', step=1000, persist_ahead=100000):
+        super().__init__(biz_tag=biz_tag, step=step)
+        self.obj_redis = obj_redis
+        self.persist_ahead = max(int(persist_ahead), step)
+        # 本进程已知的高水位
+        self.high_water = None
+
+    def next_segment(self, step=None):
+        """
+        预留下一个号段
+        计数器不存在时先用 MySQL 的高水位初始化，再 INCRBY，在同一个事务中执行
+        :param step: 号段长度，默认 self.step
+        """
+        step = step or self.step
+        floor = AppUidSegment.init_max_id(exclude=self.biz_tag)
+        persisted = AppUidSegment.get_max_id(self.biz_tag)
+        high_water = max(persisted, floor)
+        with self.obj_redis.pipeline(transaction=True) as pipe:
+            pipe.setNx(self.biz_tag, high_water, expire=False)
+            pipe.incrBy(self.biz_tag, step, expire=False)
+        max_id = pipe.results[-1]
+        # 写入高水位时计数器已到 高水位 - persist_ahead，计数器只增不减，
+        # 低于它说明 Redis 从旧的快照恢复，高水位以内的ID都可能已分配
+        if max_id - step < persisted - self.persist_ahead:
+            floor = max(floor, persisted)
+        if max_id - step < floor:
+            # 计数器落后于已分配的ID，跳到 floor 之后，再重新预留
+            self.obj_redis.incrBy(self.biz_tag, floor - (max_id - step), expire=False)
+            max_id = self.obj_redis.incrBy(self.biz_tag, step, expire=False)
+
+        # 分配之前，高水位要不低于本号段的最大ID
+        if max_id > high_water:
+            high_water = AppUidSegment.raise_max_id(self.biz_tag, max_id + self.persist_ahead,
+                                                    self.step)
+        self.high_water = high_water
+        self.next_id, self.max_id = max_id - step + 1, max_id
+        self.pid = os.getpid()
+
+    def skip_to(self, uid):
+        """
+        计数器直接加到 uid - 1
+        并发时可能多跳过一些ID，不会重复分配
+        """
+        current = int(self.obj_redis.get(self.biz_tag) or 0)
+        if current and current < uid - 1:
+            self.obj_redis.incrBy(self.biz_tag, uid - 1 - current, expire=False)
+
+
+class InsertUidAllocator:
+    """
+    每个UID在 app_global_id 中写入一行
+    创建时自增ID先跳到号段分配方式已分配的最大UID之后
+    """
+
+    def __init__(self):
+        from application.app_models.models_golbaluid import AppGlobalId
+        AppGlobalId.raise_auto_increment()
+
+    def get_new_uid(self, expect_index=None):
+        from application.app_models.models_golbaluid import AppGlobalId
+        return AppGlobalId.get_new_uid_by_insert(expect_index)
+
+    def get_new_uids(self, count, expect_index=None):
+        from application.app_models.models_golbaluid import AppGlobalId
+        return AppGlobalId.get_new_uids_by_insert(count, expect_index)
+
+
+# settings.UID_BACKEND 可选的UID分配方式
+UID_BACKENDS = {
+    'insert': lambda: InsertUidAllocator(),
+    'segment': lambda: UidSegmentAllocator(step=ApplicationConfig.UID_SEGMENT_STEP),
+    'redis': lambda: RedisUidAllocator(
+        redis_uid_client(),
+        step=ApplicationConfig.UID_SEGMENT_STEP,
+        persist_ahead=ApplicationConfig.UID_REDIS_PERSIST_AHEAD,
+    ),
+}
+
+_uid_allocators = dict()
+_uid_allocators_lock = threading.Lock()
+_expect_index = None
+
+
+def get_expect_index():
+    """
+    过滤的UID和UID区间的索引
+    ApplicationConfig.EXPECT_ID_LIST 和 ApplicationConfig.EXPECT_ID_RANGES
+    """
+    global _expect_index
+    if _expect_index is None:
+        _expect_index = IntervalIndex(
+            ids=ApplicationConfig.EXPECT_ID_LIST,
+            ranges=ApplicationConfig.EXPECT_ID_RANGES,
+        )
+    return _expect_index
+
+
+def redis_uid_client():
+    """
+    Redis 号段分配使用的 redis 实例
+    """
+    from awesome.loader import loader_redis
+    return loader_redis.obj_rd_one
+
+
+def get_uid_allocator(backend=None):
+    """
+    获取UID分配器，默认使用 settings.UID_BACKEND
+    """
+    from django.conf import settings
+    backend = backend or getattr(settings, 'UID_BACKEND', 'segment')
+    if backend not in UID_BACKENDS:
+        raise ValueError('unknown UID_BACKEND: %s' % backend)
+
+    with _uid_allocators_lock:
+        if backend not in _uid_allocators:
+            _uid_allocators[backend] = UID_BACKENDS[backend]()
+        return _uid_allocators[backend]
@@ -1,15 +1,25 @@
-from django.db import models
+from django.db import models, transaction, DatabaseError
 from django.db import connection, connections
-from awesome.helper.helper_mysql import gen_multi_model, dictfetchall
+from awesome.helper.helper_mysql import gen_multi_model, dictfetchall, scatter_gather, StatementCache, db_cursor
 from awesome.helper.helper_datetime import now
 from application.apps import ApplicationConfig
 
 
-# connection.cursor()使用默认 connections['default'].cursor()
-cursor = connections['awesome_app'].cursor()  
+# 用户信息所在的库，游标用 db_cursor(DB_NAME) 在当前线程的连接上获取
+DB_NAME = 'awesome_app'
 TABLE_PRE = ApplicationConfig.DB_APP_TABLE_PRE
 APP_LABEL = ApplicationConfig.DB_APP_LABEL
 
+# insert 的字段，和 UserInfo.insert_params 的顺序一致
+INSERT_FIELDS = ('uid', 'nickname', 'gender', 'usersig', 'userarea', 'regtime', 'entercount', 'entertme')
+
+# 参数化的SQL，按 (操作, 分表) 缓存
+statements = StatementCache({
+    'select_by_uid': "SELECT * FROM {table} WHERE uid=%s LIMIT 1",
+    'insert': "INSERT INTO {table} (" + ", ".join(INSERT_FIELDS) + ") "
+              "VALUES (" + ", ".join(["%s"] * len(INSERT_FIELDS)) + ")",
+})
+
 
 @gen_multi_model
 class UserInfo(models.Model):
@@ -28,6 +38,12 @@ class UserInfo(models.Model):
     # 分表数量
     table_piece_number = 10
 
+    # 跨分表并发查询的线程数
+    scatter_workers = 4
+
+    # 批量写入，每次 executemany 的行数，每批提交一次
+    insert_chunk_size = 500
+
     class Meta:
         abstract = True  # 抽象类是不会对应数据库表
         db_table = TABLE_PRE + 'userinfo'
@@ -45,6 +61,20 @@ class UserInfo(models.Model):
         return cls._meta.db_table + str(uid % cls.table_piece_number)
 
 
+    @classmethod
+    def group_uids_by_tb(cls, uids=None):
+        """
+        按分表分组用户ID，去重，保持每个分表内的顺序
+        :return: {table_name: [uid, ...]}
+        """
+        tb_uids = dict()
+        for uid in dict.fromkeys(int(uid or 0) for uid in uids or ()):
+            if not uid:
+                continue
+            tb_uids.setdefault(cls.get_tb_byid(uid), list()).append(uid)
+        return tb_uids
+
+
     @classmethod
     def get_userinfo_byid(cls, uid=None):
         ret_list = list()
@@ -53,14 +83,97 @@ class UserInfo(models.Model):
             return ret_list
 
         table_name = cls.get_tb_byid(uid)
-        sql = "SELECT * FROM {table} WHERE uid='{uid}' LIMIT 1"
-        cursor.execute(sql.format(table=table_name, uid=uid))
-        # raw = cursor.fetchall() 返回tuple
-        raw = dictfetchall(cursor)
+        with db_cursor(DB_NAME) as cursor:
+            ret_cursor = statements.execute(cursor, 'select_by_uid', table_name, [uid])
+            # raw = cursor.fetchall() 返回tuple
+            raw = dictfetchall(ret_cursor)
 
         return raw
 
 
+    @classmethod
+    def get_userinfo_many(cls, uids=None, union_all=False):
+        """
+        批量获取用户信息
+        按分表分组，每个分表一条 WHERE uid IN (...)，最多 table_piece_number 条查询
+        union_all=True 时用 UNION ALL 合并成一条查询
+        :return: 按 uids 的顺序，不存在的用户不返回
+        """
+        uids = [int(uid or 0) for uid in uids or ()]
+        tb_uids = cls.group_uids_by_tb(uids)
+        if not tb_uids:
+            return list()
+
+        sql = "SELECT * FROM {table} WHERE uid IN ({uids})"
+        sql_list = [
+            sql.format(table=table_name, uids=','.join(str(uid) for uid in tb_uid_list))
+            for table_name, tb_uid_list in tb_uids.items()
+        ]
+        if union_all:
+            sql_list = [' UNION ALL '.join(sql_list)]
+
+        row_dict = dict()
+        with db_cursor(DB_NAME) as cursor:
+            for sql in sql_list:
+                cursor.execute(sql)
+                for row in dictfetchall(cursor):
+                    row_dict[row['uid']] = row
+
+        return [row_dict[uid] for uid in uids if uid in row_dict]
+
+
+    @classmethod
+    def scatter_query(cls, sql=None, params=None, order_by=None, reverse=False, limit=None,
+                      max_workers=None):
+        """
+        在所有分表上执行同一条查询，并发执行后合并、排序、截取
+        sql 中的 {table} 替换为分表名
+        """
+        if not sql:
+            return list()
+
+        sql_list = [
+            (sql.format(table=cls._meta.db_table + str(piece)), params)
+            for piece in range(cls.table_piece_number)
+        ]
+        if max_workers is None:
+            max_workers = cls.scatter_workers
+        return scatter_gather(sql_list, using=DB_NAME, max_workers=max_workers,
+                              order_by=order_by, reverse=reverse, limit=limit)
+
+
+    @classmethod
+    def count_userinfo(cls):
+        """
+        所有分表的用户总数
+        """
+        rows = cls.scatter_query("SELECT COUNT(*) AS total FROM {table}")
+        return sum(row['total'] for row in rows)
+
+
+    @classmethod
+    def get_userinfo_list(cls, userarea=None, gender=None, limit=20):
+        """
+        跨分表按区域、性别查询用户，按注册时间倒序
+        每个分表取 limit 条，合并后再取 limit 条
+        """
+        where_list, params = list(), list()
+        if userarea is not None:
+            where_list.append('userarea=%s')
+            params.append(userarea)
+        if gender is not None:
+            where_list.append('gender=%s')
+            params.append(int(gender))
+
+        sql = "SELECT * FROM {table}"
+        if where_list:
+            sql += " WHERE " + " AND ".join(where_list)
+        sql += " ORDER BY regtime DESC LIMIT %s"
+        params.append(int(limit))
+
+        return cls.scatter_query(sql, params, order_by='regtime', reverse=True, limit=limit)
+
+
     @classmethod
     def get_one_userinfo(cls, uid=None):
         ret_list = list()   
@@ -73,6 +186,36 @@ class UserInfo(models.Model):
         return one
 
 
+    @classmethod
+    def insert_params(cls, uid, uinfo):
+        """
+        insert 的参数，顺序与 INSERT_FIELDS 一致
+        """
+        time_now = int(now())
+        return [
+            uid,
+            uinfo.get('nickname', ''),
+            int(uinfo.get('gender', 0) or 0),
+            uinfo.get('usersig', ''),
+            uinfo.get('userarea', ''),
+            time_now,
+            1,
+            time_now,
+        ]
+
+
+    @classmethod
+    def after_insert(cls, param_lists=None):
+        """
+        写库成功后写入缓存
+        :param param_lists: insert_params 的返回值列表
+        """
+        if not param_lists:
+            return
+        from application.app_models.models_userinfo_cache import userinfo_cache
+        userinfo_cache.set_insert_params(param_lists)
+
+
     @classmethod
     def insert_userinfo_byid(cls, uid=None, uinfo=None):
         uid = int(uid or 0)
@@ -82,43 +225,16 @@ class UserInfo(models.Model):
         if not uinfo or not isinstance(uinfo, dict):
             return None
 
-        time_now = now()
-        param_dict = dict(
-            uid=uid,
-            nickname=uinfo.get('nickname', ''),
-            gender=int(uinfo.get('gender', 0) or 0),
-            usersig=uinfo.get('usersig', ''),
-            userarea=uinfo.get('userarea', ''),
-            regtime=int(time_now),
-            entercount=1,
-            entertme=int(time_now),
-        )
         table_name = cls.get_tb_byid(uid)
-        param_dict['table'] = table_name
-
-        sql = '''INSERT INTO {table} SET uid={uid}, nickname='{nickname}', 
-                gender={gender}, usersig='{usersig}', userarea='{userarea}',
-                regtime={regtime}, entercount={entercount}, 
-                entertme={entertme}'''
-
-
-        sql = sql.format(
-            table=table_name,
-            uid=uid,
-            nickname=uinfo.get('nickname', ''),
-            gender=int(uinfo.get('gender', 0) or 0),
-            usersig=uinfo.get('usersig', ''),
-            userarea=uinfo.get('userarea', ''),
-            regtime=time_now,
-            entercount=1,
-            entertme=time_now,
-        )
-
-        flag = cursor.execute(sql.format(param_dict))
+        param_list = cls.insert_params(uid, uinfo)
+        with db_cursor(DB_NAME) as cursor:
+            flag = statements.execute(cursor, 'insert', table_name, param_list).rowcount
         
         # 此方法提交当前事务。插入或删除或修改操作后,
         # 需要调用一下conn.commit()方法进行提交,数据才会真正保 存在数据库中
-        connections['awesome_app'].commit()
+        connections[DB_NAME].commit()
+        if flag:
+            cls.after_insert([param_list])
 
         return flag
 
@@ -132,30 +248,77 @@ class UserInfo(models.Model):
         if not uinfo or not isinstance(uinfo, dict):
             return None
 
-        time_now = now()
         table_name = cls.get_tb_byid(uid)
-        
-        param_dict = dict(
-            table=table_name,
-            uid=uid,
-            nickname=uinfo.get('nickname', ''),
-            gender=int(uinfo.get('gender', 0) or 0),
-            usersig=uinfo.get('usersig', ''),
-            userarea=uinfo.get('userarea', ''),
-            regtime=int(time_now),
-            entercount=1,
-            entertme=int(time_now),
-        )
-        sql = '''INSERT INTO %s SET uid=%u, nickname='%s', 
-                gender=%u, usersig='%s', userarea='%s',
-                regtime=%u, entercount=%u,entertme=%u'''
-        
-        flag = cursor.execute(sql % tuple(param_dict.values()))
+        param_list = cls.insert_params(uid, uinfo)
+        with db_cursor(DB_NAME) as cursor:
+            flag = statements.execute(cursor, 'insert', table_name, param_list).rowcount
             
         # 此方法提交当前事务。插入或删除或修改操作后,
         # 需要调用一下conn.commit()方法进行提交,数据才会真正保 存在数据库中
-        connections['awesome_app'].commit()
+        connections[DB_NAME].commit()
+        if flag:
+            cls.after_insert([param_list])
 
         return flag
-    
-        
\ No newline at end of file
+
+
+    @classmethod
+    def insert_userinfo_many(cls, rows=None, chunk_size=None):
+        """
+        批量写入用户信息
+        按分表分组，每个分表每 chunk_size 行一次 executemany，每批提交一次
+        某批失败(如UID重复)时回滚，这一批改为逐行写入，找出失败的行
+        :param rows: [{'uid': 1, 'nickname': '', 'gender': 0, 'usersig': '', 'userarea': ''}, ...]
+        :return: 与 rows 顺序一致的状态列表，True 成功，False 失败，None 参数错误
+        """
+        rows = list(rows or ())
+        ret_list = [None] * len(rows)
+        chunk_size = int(chunk_size or cls.insert_chunk_size)
+
+        # {table_name: [(rows 中的下标, 参数), ...]}
+        tb_params = dict()
+        # 写入成功的参数
+        insert_params = list()
+        for index, uinfo in enumerate(rows):
+            if not uinfo or not isinstance(uinfo, dict):
+                continue
+            uid = int(uinfo.get('uid', 0) or 0)
+            if not uid:
+                continue
+            tb_params.setdefault(cls.get_tb_byid(uid), list()).append((index, cls.insert_params(uid, uinfo)))
+
+        for table_name, param_list in tb_params.items():
+            sql = statements.get('insert', table_name)
+            for start in range(0, len(param_list), chunk_size):
+                chunk = param_list[start:start + chunk_size]
+                try:
+                    with transaction.atomic(using=DB_NAME), db_cursor(DB_NAME) as cursor:
+                        cursor.executemany(sql, [params for _, params in chunk])
+                    status_list = [True] * len(chunk)
+                except DatabaseError:
+                    status_list = cls.insert_chunk_byrow(sql, [params for _, params in chunk])
+                for (index, params), status in zip(chunk, status_list):
+                    ret_list[index] = status
+                    if status:
+                        insert_params.append(params)
+
+        cls.after_insert(insert_params)
+        return ret_list
+
+
+    @classmethod
+    def insert_chunk_byrow(cls, sql, param_list):
+        """
+        逐行写入一批，每行一个保存点，整批提交一次
+        :return: 每行的状态
+        """
+        status_list = list()
+        with transaction.atomic(using=DB_NAME), db_cursor(DB_NAME) as cursor:
+            for params in param_list:
+                try:
+                    with transaction.atomic(using=DB_NAME):
+                        cursor.execute(sql, params)
+                    status_list.append(True)
+                except DatabaseError:
+                    status_list.append(False)
+        return status_list
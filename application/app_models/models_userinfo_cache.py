@@ -0,0 +1,173 @@
+import threading
+from redis import RedisError
+from application.apps import ApplicationConfig
+from application.app_models.models_userinfo import UserInfo, INSERT_FIELDS
+from awesome.loader import loader_redis
+
+
+class UserInfoCache:
+    """
+    用户信息缓存，每个用户一个 Redis 哈希
+    读：先读缓存，未命中再查库并写入缓存(read-through)
+    写：写库成功后覆盖缓存(write-through)
+    不存在的用户缓存一个空标记，短时间内不再查库(negative caching)
+    Redis 出错时直接查库
+    """
+
+    # 缓存的 key
+    key_tpl = 'userinfo_{uid}'
+
+    # 不存在的用户的空标记，字符串 key
+    # GET 不会刷新过期时间，空标记按 negative_expire 准时过期
+    none_key_tpl = 'userinfo_none_{uid}'
+
+    # 哈希中的值都是 str，这些字段转回 int
+    INT_FIELDS = ('uid', 'gender', 'regtime', 'entercount', 'entertme')
+
+    def __init__(self, obj_redis, expire=None, negative_expire=60):
+        """
+        obj_redis: LibRedis 实例
+        expire: 缓存的秒数，默认 LibRedis.DEFAULT_EXPIRE
+        negative_expire: 不存在的用户缓存的秒数，0 不缓存空标记
+        """
+        self.obj_redis = obj_redis
+        self.expire = expire
+        self.negative_expire = negative_expire
+        self.lock = threading.Lock()
+        self.counter = dict(hit=0, miss=0, negative_hit=0, db_query=0, error=0)
+
+    def key_make(self, uid):
+        return self.key_tpl.format(uid=uid)
+
+    def none_key_make(self, uid):
+        return self.none_key_tpl.format(uid=uid)
+
+    def incr(self, name, amount=1):
+        """
+        命中/未命中计数
+        """
+        if not amount:
+            return
+        with self.lock:
+            self.counter[name] += amount
+
+    def stats(self):
+        """
+        命中/未命中计数和命中率
+        """
+        with self.lock:
+            stats = dict(self.counter)
+        total = stats['hit'] + stats['negative_hit'] + stats['miss']
+        stats['hit_ratio'] = (stats['hit'] + stats['negative_hit']) / total if total else 0.0
+        return stats
+
+    def row_load(self, cached):
+        """
+        缓存的哈希转为和 dictfetchall 相同的 dict
+        """
+        row = dict(cached)
+        for field in self.INT_FIELDS:
+            if field in row:
+                row[field] = int(row[field])
+        return row
+
+    def get_userinfo_byid(self, uid=None):
+        """
+        获取用户信息，和 UserInfo.get_userinfo_byid 相同的返回
+        """
+        uid = int(uid or 0)
+        if not uid:
+            return list()
+        return self.get_userinfo_many([uid])
+
+    def get_userinfo_many(self, uids=None):
+        """
+        批量获取用户信息
+        一个 pipeline 读取全部缓存和空标记，未命中的用 UserInfo.get_userinfo_many 按分表查库，再一个 pipeline 写回
+        :return: 按 uids 的顺序，不存在的用户不返回
+        """
+        uids = [int(uid or 0) for uid in uids or ()]
+        uniq_uids = [uid for uid in dict.fromkeys(uids) if uid]
+        if not uniq_uids:
+            return list()
+
+        row_dict = dict()
+        miss_uids = list()
+        try:
+            with self.obj_redis.pipeline() as pipe:
+                for uid in uniq_uids:
+                    # 读缓存不刷新过期时间，按写入时的 expire 过期后重新查库
+                    pipe.hGetAll(self.key_make(uid), expire=False)
+                    pipe.get(self.none_key_make(uid))
+            cached_list = pipe.results
+        except RedisError:
+            self.incr('error')
+            cached_list = [None] * len(uniq_uids) * 2
+
+        negative_hit = 0
+        for uid, cached, is_none in zip(uniq_uids, cached_list[::2], cached_list[1::2]):
+            if cached:
+                row_dict[uid] = self.row_load(cached)
+            elif is_none:
+                negative_hit += 1
+            else:
+                miss_uids.append(uid)
+        self.incr('hit', len(row_dict))
+        self.incr('negative_hit', negative_hit)
+        self.incr('miss', len(miss_uids))
+
+        if miss_uids:
+            self.incr('db_query')
+            db_rows = UserInfo.get_userinfo_many(miss_uids)
+            for row in db_rows:
+                row_dict[row['uid']] = row
+            self.set_many(db_rows, [uid for uid in miss_uids if uid not in row_dict])
+
+        return [row_dict[uid] for uid in uids if uid in row_dict]
+
+    def set_many(self, rows=None, none_uids=None):
+        """
+        写入缓存，覆盖原来的哈希，删除空标记
+        rows: 用户信息 dict 的列表
+        none_uids: 不存在的用户ID，写入空标记
+        """
+        try:
+            with self.obj_redis.pipeline() as pipe:
+                for row in rows or ():
+                    keyname = self.key_make(row['uid'])
+                    pipe.mDelete(keyname, self.none_key_make(row['uid']))
+                    pipe.hMSet(keyname, {k: v for k, v in row.items() if v is not None},
+                               expire=self.expire)
+                for uid in none_uids if self.negative_expire else ():
+                    pipe.set(self.none_key_make(uid), 1, expire=self.negative_expire)
+        except RedisError:
+            self.incr('error')
+            # 写缓存失败时删除，避免留下旧数据
+            self.delete_many([row['uid'] for row in rows or ()])
+
+    def set_insert_params(self, param_lists=None):
+        """
+        写库成功后写入缓存(write-through)
+        param_lists: UserInfo.insert_params 的返回值列表
+        """
+        self.set_many([dict(zip(INSERT_FIELDS, params)) for params in param_lists or ()])
+
+    def delete_many(self, uids=None):
+        """
+        删除缓存，用户信息修改后调用
+        """
+        keynames = [self.key_make(uid) for uid in uids or ()]
+        if not keynames:
+            return None
+        try:
+            return self.obj_redis.mDelete(*keynames)
+        except RedisError:
+            self.incr('error')
+            return None
+
+
+userinfo_cache = UserInfoCache(
+    loader_redis.obj_rd_one,
+    expire=ApplicationConfig.USERINFO_CACHE_EXPIRE,
+    negative_expire=ApplicationConfig.USERINFO_CACHE_NEGATIVE_EXPIRE,
+)
@@ -8,3 +8,23 @@ class ApplicationConfig(AppConfig):
 
     # 过滤的UID
     EXPECT_ID_LIST = [2, 4, 5, 7, 8, 9, 10]
+
+    # 过滤的UID区间，闭区间 (start, end)
+    EXPECT_ID_RANGES = []
+
+    # UID 号段分配，每次预留的ID数量
+    UID_SEGMENT_STEP = 1000
+
+    # Redis 号段分配，高水位提前写入 MySQL 的ID数量
+    UID_REDIS_PERSIST_AHEAD = 100000
+
+    # 批量获取UID，一次最多的数量
+    UID_BATCH_MAX = 10000
+
+    # 用户信息缓存的秒数，不存在的用户缓存的秒数
+    USERINFO_CACHE_EXPIRE = 86400
+    USERINFO_CACHE_NEGATIVE_EXPIRE = 60
+
+    def ready(self):
+        from awesome.helper import helper_mysql
+        helper_mysql.enable_health_checks()
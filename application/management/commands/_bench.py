@@ -0,0 +1,96 @@
+"""
+性能测试命令的公共部分
+网络往返次数在连接上统计，真实的 redis 和 fakeredis 都适用
+"""
+import time
+from contextlib import contextmanager
+from django.core.management.base import CommandError
+
+
+def counting_connection_class(base):
+    """
+    统计网络往返次数的连接类
+    每次 send_packed_command 是一次网络往返，pipeline 中的全部命令也只发送一次
+    """
+    class CountingConnection(base):
+        round_trips = 0
+
+        def send_packed_command(self, *args, **kwargs):
+            CountingConnection.round_trips += 1
+            return super().send_packed_command(*args, **kwargs)
+
+    return CountingConnection
+
+
+def make_bench_redis(fake=False, conf=None, **kwargs):
+    """
+    性能测试用的 LibRedis，key 的前缀为 bench_
+    fake: True 使用进程内的 fakeredis，不需要 redis 服务
+    conf: [host, port, db]，默认 config.redis.rd_window
+    kwargs: LibRedis 的其他参数
+    :return: (LibRedis 实例, 连接类)，连接类的 round_trips 为网络往返次数
+    """
+    import redis
+    from awesome.config import redis as redis_conf
+    from awesome.library.lib_redis import LibRedis
+
+    conf = conf or redis_conf.rd_window
+    pool_kwargs = dict(decode_responses=bool(kwargs.get('decode_responses')))
+    if fake:
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError('--fake requires fakeredis')
+        base = getattr(fakeredis, 'FakeRedisConnection', None) or fakeredis.FakeConnection
+        pool_kwargs['server'] = fakeredis.FakeServer()
+    else:
+        base = redis.Connection
+        pool_kwargs.update(host=conf[0], port=conf[1], db=conf[2])
+
+    connection_class = counting_connection_class(base)
+    pool = redis.ConnectionPool(connection_class=connection_class, **pool_kwargs)
+    obj_redis = LibRedis(conf[0], conf[1], conf[2], prefix='bench_', connection_pool=pool, **kwargs)
+    # 先建立连接，连接时的握手命令不计入
+    obj_redis.obj_redis.ping()
+    connection_class.round_trips = 0
+    return obj_redis, connection_class
+
+
+class QueryCounter:
+    """
+    统计执行的 SQL 数量，connection.execute_wrapper(QueryCounter())
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def bench_database(db_name):
+    """
+    在临时创建的测试库中执行，结束后删除，不影响正式库
+    :return: 测试库的连接
+    """
+    from django.db import connections
+
+    connection = connections[db_name]
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def timed(func, number=1):
+    """
+    执行 number 次 func
+    :return: 平均每次的毫秒数
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1000
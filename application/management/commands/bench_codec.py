@@ -0,0 +1,53 @@
+"""
+缓存值编解码的性能测试，每种 序列化 x 压缩 的编码后字节数和编解码耗时
+small 为一个用户信息，large 为 --rows 个用户信息的列表
+python manage.py bench_codec [-n 2000] [--rows 200] [--threshold 1024]
+"""
+import timeit
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Codec benchmark: encoded size and encode/decode time per serializer x compressor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', type=int, default=2000, help='iterations')
+        parser.add_argument('--rows', type=int, default=200, help='user infos in the large blob')
+        parser.add_argument('--threshold', type=int, default=None,
+                            help='compress_threshold, default Codec.DEFAULT_COMPRESS_THRESHOLD')
+
+    @staticmethod
+    def userinfo(uid):
+        """
+        和 UserInfo.get_userinfo_byid 返回的一行相同的字段
+        """
+        return dict(uid=uid, nickname='人生若是如初见%d' % uid, gender=uid % 3, usersig='还是说说呵呵',
+                    userarea='火星', regtime=1600000000 + uid, entercount=uid % 100,
+                    entertme=1600000000 + uid * 7)
+
+    def handle(self, *args, **options):
+        from awesome.library.lib_codec import Codec, SERIALIZER_NAMES, COMPRESSOR_NAMES
+
+        n = options['n']
+        blobs = (
+            ('small', self.userinfo(10001)),
+            ('large', [self.userinfo(10001 + i) for i in range(options['rows'])]),
+        )
+        self.stdout.write('%-6s %-8s %-5s %8s %10s %10s' % (
+            'blob', 'serial', 'comp', 'bytes', 'encode us', 'decode us'))
+        for blob_name, value in blobs:
+            for serializer in SERIALIZER_NAMES:
+                for compressor in COMPRESSOR_NAMES:
+                    try:
+                        codec = Codec(serializer, compressor, compress_threshold=options['threshold'])
+                    except ValueError as e:
+                        # 没有安装 msgpack/lz4
+                        self.stdout.write('%-6s %-8s %-5s skipped: %s' % (
+                            blob_name, serializer, compressor or 'none', e))
+                        continue
+                    data = codec.dumps(value)
+                    assert codec.loads(data) == value
+                    encode_us = timeit.timeit(lambda: codec.dumps(value), number=n) / n * 1e6
+                    decode_us = timeit.timeit(lambda: codec.loads(data), number=n) / n * 1e6
+                    self.stdout.write('%-6s %-8s %-5s %8d %10.1f %10.1f' % (
+                        blob_name, serializer, compressor or 'none', len(data), encode_us, decode_us))
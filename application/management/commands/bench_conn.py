@@ -0,0 +1,50 @@
+"""
+持久连接的性能测试，请求结束时关闭连接(CONN_MAX_AGE=0) 和 保留连接复用的请求耗时
+每个请求和 WSGIHandler 一样发送 request_started/request_finished，中间查询一次用户信息
+在临时创建的测试库中执行，SQLite 的内存测试库不会关闭连接，两种设置没有区别
+python manage.py bench_conn [-n 500] [--conn-max-age 0 60]
+"""
+from unittest import mock
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+from application.management.commands._bench import bench_database, timed
+
+
+class Command(BaseCommand):
+    help = 'Request latency with and without persistent DB connections (runs in a test database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', type=int, default=500, help='requests per setting')
+        parser.add_argument('--conn-max-age', type=int, nargs='+', default=[0, 60])
+
+    def handle(self, *args, **options):
+        from application.app_models.models_userinfo import UserInfo, DB_NAME
+
+        def request():
+            # 请求开始和结束时按 CONN_MAX_AGE 关闭连接
+            request_started.send(sender=self.__class__)
+            try:
+                UserInfo.get_userinfo_byid(1)
+            finally:
+                request_finished.send(sender=self.__class__)
+
+        created = list()
+
+        def on_created(sender, connection, **kwargs):
+            created.append(connection.alias)
+
+        with bench_database(DB_NAME):
+            connection_created.connect(on_created)
+            try:
+                for conn_max_age in options['conn_max_age']:
+                    with mock.patch.dict(connections.settings[DB_NAME], CONN_MAX_AGE=conn_max_age):
+                        connections[DB_NAME].close()
+                        request()
+                        del created[:]
+                        ms = timed(request, options['n'])
+                    self.stdout.write('CONN_MAX_AGE=%-4s %.3f ms per request, %d connects in %d requests' % (
+                        conn_max_age, ms, created.count(DB_NAME), options['n']))
+            finally:
+                connection_created.disconnect(on_created)
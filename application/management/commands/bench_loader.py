@@ -0,0 +1,42 @@
+"""
+loader 的启动耗时测试，延迟创建 和 导入时立即创建客户端的对比
+python manage.py bench_loader [-n 10]
+"""
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# 在新进程中执行，计入 redis/memcache 的导入耗时
+SCRIPT = """
+import time
+start = time.perf_counter()
+from awesome.loader import loader_redis, loader_memcached
+if %(eager)s:
+    for obj in (loader_redis.obj_rd_window, loader_redis.obj_rd_one, loader_redis.obj_rd_two,
+                loader_redis.obj_rd_three, loader_memcached.one, loader_memcached.cluster):
+        obj._setup()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+class Command(BaseCommand):
+    help = 'Startup time of the cache loaders: lazy proxies vs constructing every client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', type=int, default=10, help='processes per mode')
+
+    def run(self, eager):
+        """
+        新进程中导入 loader 的毫秒数
+        """
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT % dict(eager=eager)],
+                                         cwd=settings.BASE_DIR)
+        return float(output.decode().strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for eager in (True, False):
+            times = [self.run(eager) for _ in range(options['n'])]
+            self.stdout.write('%s: median %.1f ms, min %.1f ms over %d processes' % (
+                'eager' if eager else 'lazy', statistics.median(times), min(times), len(times)))
@@ -0,0 +1,78 @@
+"""
+LibRedis 的性能测试
+python manage.py bench_redis expire [--fake] [-n 1000]
+python manage.py bench_redis decode [--fake] [-n 100] [--size 10000]
+"""
+from django.core.management.base import BaseCommand
+from application.management.commands._bench import make_bench_redis, timed
+
+
+class Command(BaseCommand):
+    help = ('LibRedis benchmarks: expire (round trips of the default EXPIRE), '
+            'decode (bytes.decode vs decode_responses on large collections)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('case', choices=['expire', 'decode'])
+        parser.add_argument('--fake', action='store_true', help='use in-process fakeredis')
+        parser.add_argument('-n', type=int, default=1000, help='iterations')
+        parser.add_argument('--size', type=int, default=10000, help='collection size for decode')
+
+    def handle(self, *args, **options):
+        getattr(self, 'case_' + options['case'])(options)
+
+    def case_expire(self, options):
+        """
+        带默认过期时间的命令，EXPIRE 单独发送 和 expire_in_pipeline 合并发送的网络往返次数
+        """
+        n = options['n']
+        for expire_in_pipeline in (False, True):
+            obj_redis, connection_class = make_bench_redis(options['fake'],
+                                                           expire_in_pipeline=expire_in_pipeline)
+
+            def calls():
+                obj_redis.set('str', 'value')
+                obj_redis.hSet('hash', 'field', 'value')
+                obj_redis.incr('counter')
+                obj_redis.lPush('list', 'value')
+                obj_redis.sAdd('set', 'value')
+                obj_redis.hGetAll('hash')
+
+            ms = timed(calls, n)
+            self.stdout.write('expire_in_pipeline=%s: %.2f round trips per call, %.3f ms per 6 calls' % (
+                expire_in_pipeline, connection_class.round_trips / (n * 6), ms))
+            obj_redis.mDelete('str', 'hash', 'counter', 'list', 'set')
+
+    def case_decode(self, options):
+        """
+        size 个元素的 list/set/hash，逐个 bytes.decode 和 decode_responses 的耗时
+        先只测结果处理(decode_* 和 native_*)，再测包含网络的 lGetRange/sMembers/hGetAll
+        """
+        from awesome.library import lib_redis
+
+        n, size = options['n'], options['size']
+        values = [('value%d' % i).encode() for i in range(size)]
+        samples = (
+            ('list', lib_redis.decode_list, values),
+            ('set', lib_redis.decode_set, set(values)),
+            ('dict', lib_redis.decode_dict, dict(zip(values, values))),
+        )
+        for name, callback, result in samples:
+            native = lib_redis.NATIVE_DECODERS[callback]
+            self.stdout.write('%s of %d: %s %.3f ms, %s %.3f ms' % (
+                name, size,
+                callback.__name__, timed(lambda: callback(result), n),
+                native.__name__, timed(lambda: native(result), n)))
+
+        items = ['value%d' % i for i in range(size)]
+        for decode_responses in (False, True):
+            obj_redis, _ = make_bench_redis(options['fake'], decode_responses=decode_responses)
+            for batch in lib_redis.chunks(items, 1000):
+                obj_redis.rPush('list', *batch)
+                obj_redis.sAdd('set', *batch)
+                obj_redis.hMSet('hash', dict(zip(batch, batch)))
+            self.stdout.write('decode_responses=%s: lGetRange %.3f ms, sMembers %.3f ms, hGetAll %.3f ms' % (
+                decode_responses,
+                timed(lambda: obj_redis.lGetRange('list', 0, -1), n),
+                timed(lambda: obj_redis.sMembers('set'), n),
+                timed(lambda: obj_redis.hGetAll('hash'), n)))
+            obj_redis.mDelete('list', 'set', 'hash')
@@ -0,0 +1,58 @@
+"""
+UID 分配的吞吐测试，每个UID写入一行 和 号段分配的对比
+在临时创建的测试库中执行，不会占用正式库的UID
+python manage.py bench_uid [-n 5000] [--backend insert segment redis] [--fake]
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import router
+from application.management.commands._bench import make_bench_redis, bench_database, QueryCounter
+
+
+class Command(BaseCommand):
+    help = 'UID allocation throughput: one INSERT per UID vs DB/Redis segments (runs in a test database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', type=int, default=5000, help='UIDs per backend')
+        parser.add_argument('--backend', nargs='+', default=['insert', 'segment'],
+                            choices=['insert', 'insert_batch', 'segment', 'redis'])
+        parser.add_argument('--fake', action='store_true', help='use in-process fakeredis for the redis backend')
+
+    def allocators(self, options):
+        """
+        {名称: 获取 n 个UID 的函数}
+        """
+        from application.apps import ApplicationConfig
+        from application.app_models.models_golbaluid import AppGlobalId
+        from application.app_models.models_uidsegment import (
+            UidSegmentAllocator, RedisUidAllocator, get_expect_index)
+
+        expect_index = get_expect_index()
+        step = ApplicationConfig.UID_SEGMENT_STEP
+
+        def one_by_one(allocator):
+            # 和 view_uid.index 一样，每次取一个UID
+            return lambda n: [allocator.get_new_uid(expect_index) for _ in range(n)]
+
+        return {
+            'insert': lambda n: [AppGlobalId.get_new_uid_by_insert(expect_index) for _ in range(n)],
+            'insert_batch': lambda n: AppGlobalId.get_new_uids_by_insert(n, expect_index),
+            'segment': one_by_one(UidSegmentAllocator('bench_segment', step)),
+            'redis': lambda n: one_by_one(RedisUidAllocator(make_bench_redis(options['fake'])[0],
+                                                            'bench_redis', step))(n),
+        }
+
+    def handle(self, *args, **options):
+        from application.app_models.models_golbaluid import AppGlobalId
+
+        with bench_database(router.db_for_write(AppGlobalId)) as connection:
+            allocators = self.allocators(options)
+            for backend in options['backend']:
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    start = time.perf_counter()
+                    uids = allocators[backend](options['n'])
+                    seconds = time.perf_counter() - start
+                assert len(set(uids)) == len(uids) == options['n']
+                self.stdout.write('%-12s %8.0f uids/s, %.3f queries per uid' % (
+                    backend, len(uids) / seconds, counter.count / len(uids)))
@@ -0,0 +1,152 @@
+"""
+UserInfo 的性能测试，在临时创建的测试库中执行
+python manage.py bench_userinfo sql [-n 10000] [--users 1000]
+python manage.py bench_userinfo cache [--fake] [-n 10000] [--users 2000] [--batch 10] [--zipf 1.1]
+python manage.py bench_userinfo scatter [-n 100] [--users 100000] [--workers 4]
+"""
+import random
+import timeit
+from django.core.management.base import BaseCommand
+from django.db import connections
+from application.management.commands._bench import bench_database, timed, make_bench_redis, QueryCounter
+
+
+class Command(BaseCommand):
+    help = ('UserInfo benchmarks: sql (per-call overhead of formatted SQL vs StatementCache), '
+            'cache (DB queries saved by UserInfoCache under a Zipfian access pattern), '
+            'scatter (scatter_query across all shards, serial vs thread pool)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('case', choices=['sql', 'cache', 'scatter'])
+        parser.add_argument('--fake', action='store_true', help='use in-process fakeredis for the cache')
+        parser.add_argument('-n', type=int, default=10000, help='iterations')
+        parser.add_argument('--users', type=int, default=1000, help='users written to the test database')
+        parser.add_argument('--batch', type=int, default=10, help='uids per request for cache')
+        parser.add_argument('--zipf', type=float, default=1.1, help='zipf exponent for cache')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='threads for scatter, default UserInfo.scatter_workers')
+
+    def handle(self, *args, **options):
+        from application.app_models.models_userinfo import DB_NAME
+
+        with bench_database(DB_NAME):
+            self.seed(options['users'])
+            getattr(self, 'case_' + options['case'])(options)
+
+    def seed(self, users):
+        """
+        写入 users 个用户，直接 executemany，不经过缓存
+        """
+        from awesome.helper.helper_mysql import db_cursor
+        from application.app_models.models_userinfo import UserInfo, DB_NAME, statements
+
+        tb_uids = UserInfo.group_uids_by_tb(range(1, users + 1))
+        with db_cursor(DB_NAME) as cursor:
+            for table_name, uids in tb_uids.items():
+                cursor.executemany(statements.get('insert', table_name), [
+                    UserInfo.insert_params(uid, dict(nickname='nick%d' % uid)) for uid in uids])
+
+    def case_sql(self, options):
+        """
+        每次调用的开销：每次 str.format 拼接SQL 和 StatementCache 缓存的参数化SQL
+        先只测生成SQL，再测包含查询的 get_userinfo_byid
+        """
+        from awesome.helper.helper_mysql import db_cursor, dictfetchall
+        from application.app_models.models_userinfo import UserInfo, DB_NAME, statements
+
+        n, users = options['n'], options['users']
+        uid = users // 2
+        table_name = UserInfo.get_tb_byid(uid)
+        sql_tpl = "SELECT * FROM {table} WHERE uid='{uid}' LIMIT 1"
+
+        format_us = timeit.timeit(lambda: sql_tpl.format(table=table_name, uid=uid), number=n) / n * 1e6
+        cached_us = timeit.timeit(lambda: statements.get('select_by_uid', table_name), number=n) / n * 1e6
+        self.stdout.write('build sql:  str.format %.2f us, StatementCache %.2f us' % (format_us, cached_us))
+
+        uids = [i % users + 1 for i in range(n)]
+
+        def formatted():
+            # 修改前的 get_userinfo_byid，每次拼接SQL
+            for uid in uids:
+                with db_cursor(DB_NAME) as cursor:
+                    cursor.execute(sql_tpl.format(table=UserInfo.get_tb_byid(uid), uid=uid))
+                    dictfetchall(cursor)
+
+        def cached():
+            for uid in uids:
+                UserInfo.get_userinfo_byid(uid)
+
+        for name, func in (('str.format', formatted), ('StatementCache', cached)):
+            self.stdout.write('get_userinfo_byid: %-14s %.1f us per call' % (name, timed(func) / n * 1000))
+
+    def case_cache(self, options):
+        """
+        n 个请求，每个请求读取 batch 个用户，用户ID按 Zipf 分布，少数热门用户占大部分访问
+        不用缓存逐个查库、缓存逐个读取、缓存批量读取 三种方式的查库次数
+        用户ID 超出 users 的部分不存在，测试空标记
+        """
+        from application.app_models.models_userinfo import UserInfo, DB_NAME
+        from application.app_models.models_userinfo_cache import UserInfoCache
+
+        n, users, batch = options['n'], options['users'], options['batch']
+        population = range(1, users + users // 10 + 1)
+        weights = [1 / rank ** options['zipf'] for rank in population]
+        rnd = random.Random(1)
+        requests = [rnd.choices(population, weights=weights, k=batch) for _ in range(n)]
+
+        def no_cache():
+            for uids in requests:
+                for uid in uids:
+                    UserInfo.get_userinfo_byid(uid)
+
+        def cache_single(cache):
+            for uids in requests:
+                for uid in uids:
+                    cache.get_userinfo_byid(uid)
+
+        def cache_many(cache):
+            for uids in requests:
+                cache.get_userinfo_many(uids)
+
+        cases = (('no cache', None), ('cache byid', cache_single), ('cache many', cache_many))
+        for name, func in cases:
+            cache = None
+            if func is not None:
+                obj_redis, _ = make_bench_redis(options['fake'])
+                cache = UserInfoCache(obj_redis)
+                obj_redis.mDelete(*[cache.key_make(uid) for uid in population])
+                obj_redis.mDelete(*[cache.none_key_make(uid) for uid in population])
+            counter = QueryCounter()
+            with connections[DB_NAME].execute_wrapper(counter):
+                ms = timed(no_cache if func is None else lambda: func(cache))
+            line = '%-10s %6d queries for %d reads, %.3f ms per request' % (
+                name, counter.count, n * batch, ms / n)
+            if cache is not None:
+                stats = cache.stats()
+                line += ', hit ratio %.3f, %d negative hits' % (stats['hit_ratio'], stats['negative_hit'])
+            self.stdout.write(line)
+
+    def case_scatter(self, options):
+        """
+        在全部 table_piece_number 个分表上执行同一条查询，max_workers=1 依次执行 和 线程池并发执行的耗时
+        查询每个分表按注册时间排序的前 20 个用户 和 每个分表的用户数
+        """
+        from application.app_models.models_userinfo import UserInfo
+
+        n = options['n']
+        workers = options['workers'] or UserInfo.scatter_workers
+        queries = (
+            ('top 20', "SELECT * FROM {table} ORDER BY regtime DESC LIMIT %s", [20],
+             dict(order_by='regtime', reverse=True, limit=20)),
+            ('count', "SELECT COUNT(*) AS total FROM {table}", None, dict()),
+        )
+        for name, sql, params, kwargs in queries:
+            results, ms = dict(), dict()
+            for max_workers in (1, workers):
+                # 先执行一次，线程池的线程和连接不计入
+                results[max_workers] = UserInfo.scatter_query(sql, params, max_workers=max_workers, **kwargs)
+                ms[max_workers] = timed(lambda: UserInfo.scatter_query(
+                    sql, params, max_workers=max_workers, **kwargs), n)
+            assert results[1] == results[workers]
+            self.stdout.write('%-7s %d shards: serial %.3f ms, %d workers %.3f ms, speedup %.2fx' % (
+                name, UserInfo.table_piece_number, ms[1], workers, ms[workers], ms[1] / ms[workers]))
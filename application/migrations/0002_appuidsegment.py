@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppUidSegment',
+            fields=[
+                ('biz_tag', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='业务标识')),
+                ('max_id', models.BigIntegerField(verbose_name='已分配出去的最大ID')),
+                ('step', models.PositiveIntegerField(verbose_name='号段长度')),
+                ('update_time', models.PositiveIntegerField(verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'UID号段',
+                'verbose_name_plural': 'UID号段',
+                'db_table': 'app_uid_segment',
+                'managed': True,
+            },
+        ),
+    ]
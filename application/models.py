@@ -4,8 +4,9 @@ migrate 生成创建mysql表
 from application.app_models.models_golbaluid import AppGlobalId
 from application.app_models.models_userinfo import UserInfo
 from application.app_models.models_uidopenid import AppUidOpenid
+from application.app_models.models_uidsegment import AppUidSegment
 
-ALL = [AppGlobalId, UserInfo, AppUidOpenid]
+ALL = [AppGlobalId, UserInfo, AppUidOpenid, AppUidSegment]
 
 
 # 创建所有的model，数据库表
@@ -1,20 +1,693 @@
-from django.test import TestCase
+"""
+测试
+python manage.py test application
+redis 使用进程内的 fakeredis，memcached 使用进程内的 FakeMemcacheClient
+"""
+import collections
+import threading
+import time
+from unittest import skipIf
+from unittest import mock
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from awesome.helper.helper_interval import IntervalIndex
+from awesome.library.lib_codec import Codec
+from awesome.library.lib_hashring import HashRing
+from awesome.library.lib_local_cache import LocalCache, MISSING
+from awesome.library.lib_memcached import LibMemcached
+from awesome.library.lib_redis import LibRedis
 
-# Create your tests here.
-from awesome.loader import loader_redis
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
-print(loader_redis.obj_rd_window.set('xx',1))
+# fakeredis 执行 Lua 脚本需要 lupa
+try:
+    import lupa
+except ImportError:
+    lupa = None
 
-print(loader_redis.obj_rd_window.append('xx',2))
+# 手动测试 redis 连接
+# from awesome.loader import loader_redis
 
-print(loader_redis.obj_rd_window.get('xx'))
+# print(loader_redis.obj_rd_window.set('xx',1))
 
-print(loader_redis.obj_rd_window.incr('xx'))
+# print(loader_redis.obj_rd_window.append('xx',2))
 
-print(loader_redis.obj_rd_window.incrby('xx',9))
+# print(loader_redis.obj_rd_window.get('xx'))
 
-print(loader_redis.obj_rd_window.decr('xx'))
+# print(loader_redis.obj_rd_window.incr('xx'))
 
-print(loader_redis.obj_rd_window.decrby('xx',9))
+# print(loader_redis.obj_rd_window.incrby('xx',9))
 
-print(loader_redis.obj_rd_window.delete('xx'))
+# print(loader_redis.obj_rd_window.decr('xx'))
+
+# print(loader_redis.obj_rd_window.decrby('xx',9))
+
+# print(loader_redis.obj_rd_window.delete('xx'))
+
+
+class FakeMemcacheClient:
+    """
+    进程内的 memcache.Client 替身，只实现 LibMemcached 用到的方法
+    """
+
+    def __init__(self):
+        self.data = dict()
+        # 每个 key 写入时的过期秒数
+        self.times = dict()
+        # 每个 key 的版本号，每次写入加 1，用作 CAS 值
+        self.versions = collections.Counter()
+        self.lock = threading.Lock()
+        # memcache.Client 是 threading.local，gets 记录的 CAS 值每个线程一份
+        self.local = threading.local()
+
+    @property
+    def cas_ids(self):
+        if not hasattr(self.local, 'cas_ids'):
+            self.local.cas_ids = dict()
+        return self.local.cas_ids
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def _store(self, key, value, time):
+        self.versions[key] += 1
+        if time < 0:
+            # 负的过期时间，立即过期
+            self.data.pop(key, None)
+            self.times.pop(key, None)
+        else:
+            self.data[key] = value
+            self.times[key] = time
+
+    def set(self, key, value, time=0):
+        with self.lock:
+            self._store(key, value, time)
+        return True
+
+    def add(self, key, value, time=0):
+        with self.lock:
+            if key in self.data:
+                return False
+            self._store(key, value, time)
+            return True
+
+    def gets(self, key):
+        with self.lock:
+            if key in self.data:
+                self.cas_ids[key] = self.versions[key]
+            return self.data.get(key)
+
+    def cas(self, key, value, time=0):
+        with self.lock:
+            if key not in self.cas_ids:
+                self._store(key, value, time)
+                return True
+            if key not in self.data or self.versions[key] != self.cas_ids[key]:
+                return False
+            self._store(key, value, time)
+            return True
+
+    def reset_cas(self):
+        self.cas_ids.clear()
+
+    def delete(self, key):
+        with self.lock:
+            self.versions[key] += 1
+            self.data.pop(key, None)
+        return 1
+
+    def get_multi(self, keys, key_prefix=''):
+        return {key: self.data[key_prefix + key] for key in keys if key_prefix + key in self.data}
+
+    def set_multi(self, mapping, time=0, key_prefix=''):
+        for key, value in mapping.items():
+            self.data[key_prefix + key] = value
+        return list()
+
+    def delete_multi(self, keys, key_prefix=''):
+        for key in keys:
+            self.data.pop(key_prefix + key, None)
+        return 1
+
+    def disconnect_all(self):
+        pass
+
+
+def fake_lib_redis(**kwargs):
+    """
+    使用进程内 fakeredis 的 LibRedis，每次调用是一个新的空 redis
+    """
+    import redis
+    connection_class = getattr(fakeredis, 'FakeRedisConnection', None) or fakeredis.FakeConnection
+    pool = redis.ConnectionPool(connection_class=connection_class, server=fakeredis.FakeServer(),
+                                decode_responses=bool(kwargs.get('decode_responses')))
+    return LibRedis('fakeredis', 6379, 0, connection_pool=pool, **kwargs)
+
+
+def fake_memcached_cluster(servers):
+    """
+    多节点的 LibMemcached，每个节点是一个 FakeMemcacheClient
+    """
+    obj_memcached = LibMemcached(servers=servers)
+    for node in obj_memcached.obj_clients:
+        obj_memcached.obj_clients[node] = FakeMemcacheClient()
+    return obj_memcached
+
+
+class CodecTest(SimpleTestCase):
+    """
+    值的编解码，开启 codec 之前写入的值仍然可以读取
+    """
+
+    def test_round_trip(self):
+        codec = Codec(serializer='pickle', compressor='zlib', compress_threshold=16)
+        for value in ('text', b'\x07bytes', {'a': [1, 2]}, 'x' * 4096, 12):
+            self.assertEqual(codec.loads(codec.dumps(value)), value)
+
+    def test_plain_values(self):
+        codec = Codec()
+        # 开启 codec 之前写入的值原样返回，不抛出异常
+        for raw, value in ((b'x', 'x'), (b'7', '7'), (b'\x07', '\x07'), (b'\xfe', b'\xfe'),
+                           (b'\xfe\xff{}', b'\xfe\xff{}'), (b'\xfe\x02{bad', b'\xfe\x02{bad'),
+                           ('already str', 'already str')):
+            self.assertEqual(codec.loads(raw), value)
+        self.assertIsNone(codec.loads(None))
+
+    @skipIf(fakeredis is None, 'requires fakeredis')
+    def test_redis_strip(self):
+        # 有没有 codec，str 都去掉首尾空白后存储
+        for codec in (None, Codec(serializer='pickle')):
+            obj_redis = fake_lib_redis(codec=codec)
+            obj_redis.set('str', '  x  ')
+            obj_redis.hSet('hash', 'field', '  x  ')
+            obj_redis.hMSet('hash', {'other': '  x  ', 'number': 7})
+            obj_redis.mSet({'m1': '  x  '})
+            self.assertEqual(obj_redis.get('str'), 'x')
+            self.assertEqual(obj_redis.hGet('hash', 'field'), 'x')
+            self.assertEqual(obj_redis.hMGet('hash', 'other', 'number'), ['x', 7 if codec else '7'])
+            self.assertEqual(obj_redis.mGet(['m1']), ['x'])
+
+
+class LocalCacheTest(SimpleTestCase):
+    """
+    L1 缓存：返回的值可以修改，读取期间清除的 key 不缓存旧值
+    """
+
+    def test_mutation_does_not_leak(self):
+        local_cache = LocalCache(ttl=60)
+        value = dict(nickname='nick', tags=['a'])
+        self.assertEqual(local_cache.get_or_load('key', lambda: value), value)
+        value['tags'].append('b')
+        local_cache.get('key')['tags'].append('c')
+        self.assertEqual(local_cache.get('key'), dict(nickname='nick', tags=['a']))
+
+    def test_invalidate_during_load(self):
+        local_cache = LocalCache(ttl=60)
+        loading, invalidated = threading.Event(), threading.Event()
+
+        def loader():
+            # 读到旧值后，写操作清除了 key
+            loading.set()
+            invalidated.wait(5)
+            return 'old'
+
+        thread = threading.Thread(target=local_cache.get_or_load, args=('key', loader))
+        thread.start()
+        loading.wait(5)
+        local_cache.invalidate('key')
+        invalidated.set()
+        thread.join()
+        self.assertIs(local_cache.get('key'), MISSING)
+        self.assertEqual(local_cache.get_or_load('key', lambda: 'new'), 'new')
+        self.assertEqual(local_cache.get('key'), 'new')
+        self.assertEqual(local_cache.loading, {})
+
+    @skipIf(fakeredis is None, 'requires fakeredis')
+    def test_pipeline_invalidates_after_execute(self):
+        obj_redis = fake_lib_redis(local_cache=LocalCache(ttl=60))
+        obj_redis.set('key', 'old')
+        obj_redis.mSet({'many': 'old'})
+        with obj_redis.pipeline() as pipe:
+            pipe.set('key', 'new')
+            pipe.mSet({'many': 'new'})
+            # execute 之前并发的读取，把旧值放入 L1
+            self.assertEqual(obj_redis.get('key'), 'old')
+            self.assertEqual(obj_redis.get('many'), 'old')
+        self.assertEqual(obj_redis.get('key'), 'new')
+        self.assertEqual(obj_redis.get('many'), 'new')
+        self.assertEqual(pipe.invalidate_keys, [])
+
+
+class IntervalIndexTest(SimpleTestCase):
+    """
+    保留UID/区间的索引
+    """
+
+    def test_merge_and_lookup(self):
+        index = IntervalIndex(ids=[1, 2, 3, 10], ranges=[(4, 6), (20, 30), (25, 40), (50, 49)])
+        # [1, 6], [10, 10], [20, 40]，结束小于开始的区间忽略
+        self.assertEqual(len(index), 3)
+        self.assertEqual([v for v in range(0, 45) if v in index],
+                         list(range(1, 7)) + [10] + list(range(20, 41)))
+        self.assertEqual(index.next_free(0), 0)
+        self.assertEqual(index.next_free(1), 7)
+        self.assertEqual(index.next_free(10), 11)
+        self.assertEqual(index.next_free(25), 41)
+        self.assertEqual(index.next_free(49), 49)
+
+    def test_100k_reserved_ids(self):
+        index = IntervalIndex(ids=range(2, 200002, 2))
+        self.assertEqual(len(index), 100000)
+        self.assertIn(199998, index)
+        self.assertNotIn(199999, index)
+        self.assertNotIn(200002, index)
+        self.assertEqual(index.next_free(100000), 100001)
+        self.assertEqual(index.next_free(100001), 100001)
+
+
+class HashRingTest(SimpleTestCase):
+    """
+    ketama 一致性哈希的分布和增删节点时的重新分布
+    """
+
+    keys = ['key_%d' % i for i in range(100000)]
+
+    def distribution(self, ring):
+        return collections.Counter(ring.get_node(key) for key in self.keys)
+
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing().get_node('key'))
+
+    def test_weighted_distribution(self):
+        ring = HashRing({'a': 1, 'b': 1, 'c': 1, 'd': 2})
+        counter = self.distribution(ring)
+        # 理想分布 20/20/20/40%，允许 ±5%
+        for node, share in (('a', 0.2), ('b', 0.2), ('c', 0.2), ('d', 0.4)):
+            self.assertAlmostEqual(counter[node] / len(self.keys), share, delta=0.05)
+
+    def test_add_node_remaps_one_nth(self):
+        ring = HashRing({'a': 1, 'b': 1, 'c': 1, 'd': 2})
+        before = {key: ring.get_node(key) for key in self.keys}
+        ring.add_node('e', 1)
+        moved = [key for key in self.keys if ring.get_node(key) != before[key]]
+
+        # 只移动到新节点，大约 1/6
+        self.assertTrue(all(ring.get_node(key) == 'e' for key in moved))
+        self.assertAlmostEqual(len(moved) / len(self.keys), 1 / 6, delta=0.04)
+
+        ring.remove_node('e')
+        self.assertEqual({key: ring.get_node(key) for key in self.keys}, before)
+
+
+class LibMemcachedClusterTest(SimpleTestCase):
+    """
+    多节点的 LibMemcached，key 按哈希环分布到各节点
+    """
+
+    servers = [['10.0.0.1', 11211, 1], ['10.0.0.2', 11211, 1], ['10.0.0.3', 11211, 1]]
+
+    def test_keys_follow_ring(self):
+        obj_memcached = fake_memcached_cluster(self.servers)
+        mapping = {'key_%d' % i: 'value_%d' % i for i in range(3000)}
+        self.assertEqual(obj_memcached.set_multi(mapping), [])
+
+        for key in mapping:
+            keyname = obj_memcached.key_make(key)
+            node = obj_memcached.hash_ring.get_node(keyname)
+            self.assertIn(keyname, obj_memcached.obj_clients[node].data)
+        # 每个节点都分到了 key
+        self.assertTrue(all(client.data for client in obj_memcached.obj_clients.values()))
+
+        self.assertEqual(obj_memcached.get_multi(list(mapping)), mapping)
+        self.assertEqual(obj_memcached.get('key_7'), 'value_7')
+        self.assertEqual(obj_memcached.delete_multi(list(mapping)), 1)
+        self.assertEqual(obj_memcached.get_multi(list(mapping)), {})
+
+
+@skipIf(fakeredis is None, 'requires fakeredis')
+class MemcachedGetOrComputeTest(SimpleTestCase):
+    """
+    LibMemcached.get_or_compute 的过期时间和锁
+    """
+
+    def make_memcached(self, client=None):
+        obj_memcached = LibMemcached()
+        obj_memcached.obj_memcached = client or FakeMemcacheClient()
+        return obj_memcached
+
+    def test_stale_window_with_default_ttl(self):
+        obj_memcached = self.make_memcached()
+        client = obj_memcached.obj_memcached
+        self.assertEqual(obj_memcached.get_or_compute('hot', lambda: 'value'), 'value')
+        keyname = obj_memcached.key_make('hot')
+        # 逻辑过期后，旧值还保留 stale_ttl 秒，且不超过 memcached 的 30 天
+        logical_ttl = client.data[keyname]['e'] - time.time()
+        self.assertGreaterEqual(client.times[keyname] - logical_ttl, 299)
+        self.assertLessEqual(client.times[keyname], LibMemcached.DEFAULT_EXPIRE)
+        self.assertNotIn(keyname + ':lock', client.data)
+
+    def test_unlock_keeps_lock_of_others(self):
+        class RacingClient(FakeMemcacheClient):
+            """
+            读取锁之后，锁立即过期并被其他进程抢到
+            """
+            def get(self, key):
+                return self.steal(key, super().get(key))
+
+            def gets(self, key):
+                return self.steal(key, super().gets(key))
+
+            def steal(self, key, value):
+                if key.endswith(':lock'):
+                    self.set(key, 'other', 10)
+                return value
+
+        obj_memcached = self.make_memcached(RacingClient())
+        self.assertEqual(obj_memcached.get_or_compute('hot', lambda: 'value'), 'value')
+        lock_key = obj_memcached.key_make('hot') + ':lock'
+        self.assertEqual(obj_memcached.obj_memcached.data[lock_key], 'other')
+
+
+@skipIf(fakeredis is None or lupa is None, 'requires fakeredis and lupa')
+class LibRedisScriptTest(SimpleTestCase):
+    """
+    Lua 脚本的计数方法，expire=False 不设置过期时间
+    """
+
+    def test_incr_expire(self):
+        obj_redis = fake_lib_redis()
+        ttl = lambda keyname: obj_redis.obj_redis.ttl(obj_redis.key_make(keyname))
+
+        self.assertEqual(obj_redis.incrWithTtl('forever', 2, expire=False), 2)
+        self.assertEqual(obj_redis.incrWithTtl('forever', 3, expire=0), 5)
+        self.assertEqual(ttl('forever'), -1)
+        obj_redis.incrWithTtl('window', expire=30)
+        obj_redis.incrWithTtl('window', expire=300)
+        self.assertTrue(0 < ttl('window') <= 30)
+        obj_redis.incrWithTtl('default')
+        self.assertTrue(0 < ttl('default') <= obj_redis.DEFAULT_EXPIRE * 2)
+
+        with obj_redis.pipeline() as pipe:
+            pipe.incrWithTtl('pipe_forever', expire=False)
+            pipe.hIncrCapped('pipe_hash', 'field', cap=10, expire=False)
+        self.assertEqual(pipe.results, [1, 1])
+        self.assertEqual(ttl('pipe_forever'), -1)
+        self.assertEqual(ttl('pipe_hash'), -1)
+
+
+class GetOrComputeRaceTest(SimpleTestCase):
+    """
+    多个线程同时读取同一个热点 key，只有一个线程计算
+    """
+
+    threads = 20
+
+    def race(self, get_or_compute, value, ttl):
+        """
+        threads 个线程同时调用 get_or_compute，计算耗时 0.2 秒
+        :return: (计算次数, 各线程的返回值)
+        """
+        barrier = threading.Barrier(self.threads)
+        calls, results, errors = list(), list(), list()
+
+        def fn():
+            calls.append(value)
+            time.sleep(0.2)
+            return value
+
+        def work():
+            try:
+                barrier.wait(5)
+                results.append(get_or_compute('hot', fn, ttl=ttl))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return len(calls), results
+
+    def assert_single_flight(self, get_or_compute):
+        # 没有旧值：一个线程计算，其他线程等待结果
+        calls, results = self.race(get_or_compute, 'old', ttl=1)
+        self.assertEqual(calls, 1)
+        self.assertEqual(results, ['old'] * self.threads)
+
+        # 逻辑过期：一个线程刷新，其他线程返回旧值
+        time.sleep(1.1)
+        calls, results = self.race(get_or_compute, 'new', ttl=60)
+        self.assertEqual(calls, 1)
+        self.assertLessEqual(set(results), {'old', 'new'})
+        self.assertIn('new', results)
+        self.assertEqual(get_or_compute('hot', lambda: 'again', ttl=60), 'new')
+
+    @skipIf(fakeredis is None or lupa is None, 'requires fakeredis and lupa')
+    def test_redis(self):
+        obj_redis = fake_lib_redis(decode_responses=True)
+        self.assert_single_flight(obj_redis.get_or_compute)
+        self.assertIsNone(obj_redis.obj_redis.get(obj_redis.key_make('hot') + ':lock'))
+
+    def test_memcached(self):
+        obj_memcached = LibMemcached()
+        obj_memcached.obj_memcached = FakeMemcacheClient()
+        self.assert_single_flight(obj_memcached.get_or_compute)
+        self.assertNotIn(obj_memcached.key_make('hot') + ':lock', obj_memcached.obj_memcached.data)
+
+
+@skipIf(fakeredis is None, 'requires fakeredis')
+class UidBackendSwitchTest(TestCase):
+    """
+    切换UID分配方式，不会重复分配已分配的UID
+    """
+
+    databases = {'default', 'awesome_app'}
+
+    def test_switch_backends(self):
+        from application.app_models.models_uidsegment import (
+            UidSegmentAllocator, RedisUidAllocator, InsertUidAllocator)
+
+        obj_redis = fake_lib_redis()
+        allocators = [
+            InsertUidAllocator,
+            lambda: UidSegmentAllocator(step=10),
+            lambda: RedisUidAllocator(obj_redis, step=10, persist_ahead=10),
+            lambda: UidSegmentAllocator(step=10),
+            InsertUidAllocator,
+            lambda: RedisUidAllocator(obj_redis, step=10, persist_ahead=10),
+            lambda: UidSegmentAllocator(step=10),
+        ]
+        issued = list()
+        for make_allocator in allocators:
+            # 每次切换相当于重启，新建分配器
+            uids = make_allocator().get_new_uids(5)
+            self.assertGreater(min(uids), max(issued, default=0))
+            issued.extend(uids)
+        self.assertEqual(len(set(issued)), len(issued))
+
+    def test_stale_redis_counter(self):
+        from application.app_models.models_uidsegment import RedisUidAllocator
+
+        obj_redis = fake_lib_redis()
+        allocator = RedisUidAllocator(obj_redis, step=10, persist_ahead=10)
+        issued = allocator.get_new_uids(10)
+        saved = obj_redis.get(allocator.biz_tag)
+        issued += allocator.get_new_uids(30)
+        # 正常分配时号段连续，不会误判为旧的计数器
+        self.assertEqual(issued, list(range(1, 41)))
+
+        # Redis 从旧的快照恢复，计数器回到之前的值
+        obj_redis.set(allocator.biz_tag, saved, expire=False)
+        issued += RedisUidAllocator(obj_redis, step=10, persist_ahead=10).get_new_uids(30)
+        self.assertEqual(len(set(issued)), len(issued))
+        self.assertGreater(min(issued[40:]), 40)
+
+    def test_redis_counter_never_expires(self):
+        from application.app_models.models_uidsegment import RedisUidAllocator
+        obj_redis = fake_lib_redis()
+        allocator = RedisUidAllocator(obj_redis, step=10, persist_ahead=10)
+        # 跳过区间时 skip_to 也不设置过期时间
+        allocator.get_new_uids(30, IntervalIndex(ranges=[(5, 15)]))
+        self.assertEqual(obj_redis.obj_redis.ttl(obj_redis.key_make(allocator.biz_tag)), -1)
+
+
+class ScatterGatherTest(TransactionTestCase):
+    """
+    并发查询的线程常驻，线程中的数据库连接按 CONN_MAX_AGE 跨调用复用
+    """
+
+    databases = {'awesome_app'}
+
+    def count_connects(self, conn_max_age, times=5):
+        """
+        多次并发查询10个分表，新建的连接数
+        """
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from awesome.helper.helper_mysql import scatter_gather
+
+        created = list()
+
+        def on_created(sender, connection, **kwargs):
+            if connection.alias == 'awesome_app':
+                created.append(connection)
+
+        sql_list = [("SELECT %s AS piece", [piece]) for piece in range(10)]
+        connection_created.connect(on_created)
+        try:
+            with mock.patch.dict(connections.settings['awesome_app'], CONN_MAX_AGE=conn_max_age):
+                for _ in range(times):
+                    rows = scatter_gather(sql_list, using='awesome_app', max_workers=4,
+                                          order_by='piece')
+                    self.assertEqual([row['piece'] for row in rows], list(range(10)))
+        finally:
+            connection_created.disconnect(on_created)
+        return len(created)
+
+    def test_reuse_connections(self):
+        # 5次查询10个分表，最多每个线程一个连接
+        self.assertLessEqual(self.count_connects(60), 4)
+
+
+class UserInfoThreadTest(TransactionTestCase):
+    """
+    多个线程同时查询用户信息，每个线程使用自己的连接和游标
+    """
+
+    databases = {'awesome_app'}
+
+    def setUp(self):
+        from awesome.helper.helper_mysql import db_cursor
+        from application.app_models.models_userinfo import UserInfo, DB_NAME, statements
+
+        # 直接写库，不经过缓存
+        with db_cursor(DB_NAME) as cursor:
+            for table_name, uids in UserInfo.group_uids_by_tb(range(1, 1001)).items():
+                cursor.executemany(statements.get('insert', table_name), [
+                    UserInfo.insert_params(uid, dict(nickname='nick%d' % uid)) for uid in uids])
+
+    def test_concurrent_reads(self):
+        from django.db import connections
+        from application.app_models.models_userinfo import UserInfo, DB_NAME
+
+        errors, done = list(), list()
+        thread_connections = list()
+
+        def work(seed):
+            try:
+                for i in range(100):
+                    uid = (seed * 100 + i) % 1000 + 1
+                    rows = UserInfo.get_userinfo_byid(uid)
+                    self.assertEqual([row['nickname'] for row in rows], ['nick%d' % uid])
+                    uids = [uid, uid % 1000 + 1, 5000]
+                    rows = UserInfo.get_userinfo_many(uids)
+                    self.assertEqual([row['uid'] for row in rows], uids[:2])
+                    done.append(uid)
+                thread_connections.append(connections[DB_NAME])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(seed,)) for seed in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(done), 16 * 100)
+        self.assertEqual(len(set(map(id, thread_connections))), 16)
+
+
+@skipIf(fakeredis is None, 'requires fakeredis')
+class UserInfoCacheTest(TestCase):
+    """
+    用户信息缓存的过期时间：读缓存不刷新，写入时一次设置
+    """
+
+    databases = {'awesome_app'}
+
+    def test_read_keeps_ttl(self):
+        from awesome.helper.helper_mysql import db_cursor
+        from application.app_models.models_userinfo import UserInfo, DB_NAME, statements
+        from application.app_models.models_userinfo_cache import UserInfoCache
+
+        with db_cursor(DB_NAME) as cursor:
+            cursor.execute(statements.get('insert', UserInfo.get_tb_byid(7)),
+                           UserInfo.insert_params(7, dict(nickname='nick7')))
+        obj_redis = fake_lib_redis()
+        cache = UserInfoCache(obj_redis, expire=600, negative_expire=60)
+        ttl = lambda keyname: obj_redis.obj_redis.ttl(obj_redis.key_make(keyname))
+
+        self.assertEqual(cache.get_userinfo_many([7, 8])[0]['nickname'], 'nick7')
+        self.assertTrue(0 < ttl(cache.key_make(7)) <= 600)
+        self.assertTrue(0 < ttl(cache.none_key_make(8)) <= 60)
+
+        obj_redis.obj_redis.expire(obj_redis.key_make(cache.key_make(7)), 5)
+        self.assertEqual(cache.get_userinfo_many([7, 8])[0]['nickname'], 'nick7')
+        self.assertEqual(cache.stats()['hit'], 1)
+        self.assertEqual(cache.stats()['negative_hit'], 1)
+        self.assertTrue(0 < ttl(cache.key_make(7)) <= 5)
+
+
+class InsertAllViewTest(SimpleTestCase):
+    """
+    批量写入用户的 count 参数
+    """
+
+    def test_invalid_count(self):
+        from django.test import RequestFactory
+        from application import views
+
+        for count in ('abc', '-5', ''):
+            response = views.insert_all(RequestFactory().get('/', dict(count=count)))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'AppGlobalId.get_new_uids() None')
+
+
+class ReservedUidTest(TestCase):
+    """
+    10万个保留UID和一个大的保留区间，两种分配方式都直接跳过，不逐个预留/写入
+    """
+
+    databases = {'default', 'awesome_app'}
+
+    @staticmethod
+    def expect_index():
+        # [10, 500009] 以及 500010 之后的 10万个偶数
+        return IntervalIndex(ids=range(500010, 700010, 2), ranges=[(10, 500009)])
+
+    def assert_uids(self, uids, index):
+        self.assertEqual(uids[:9], list(range(1, 10)))
+        self.assertEqual(len(set(uids)), len(uids))
+        self.assertFalse([uid for uid in uids if uid in index])
+
+    def test_segment_allocator(self):
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+        from application.app_models.models_uidsegment import UidSegmentAllocator, AppUidSegment
+
+        index = self.expect_index()
+        allocator = UidSegmentAllocator(biz_tag='uid_test', step=100)
+        with CaptureQueriesContext(connections['awesome_app']) as queries:
+            uids = [allocator.get_new_uid(index) for _ in range(2000)]
+        self.assert_uids(uids, index)
+        self.assertEqual(uids[9], 500011)
+        # 号段跳过区间，没有为区间中的 50万个ID逐段预留
+        self.assertLess(len(queries), 500)
+        self.assertLess(AppUidSegment.get_max_id('uid_test'), uids[-1] + 200)
+
+    def test_insert_allocator(self):
+        from application.app_models.models_golbaluid import AppGlobalId
+
+        index = self.expect_index()
+        uids = [AppGlobalId.get_new_uid_by_insert(index) for _ in range(20)]
+        uids += AppGlobalId.get_new_uids_by_insert(200, index)
+        self.assert_uids(uids, index)
+        self.assertEqual(uids[9], 500011)
+        # 区间只写入一行跳过，区间之后的偶数各占一行
+        self.assertLessEqual(AppGlobalId.objects.count(), len(uids) * 2 + 2)
@@ -1,18 +1,27 @@
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from application.apps import ApplicationConfig
 from application.app_models.models_golbaluid import AppGlobalId
 
 
 def index(request):
     """
     index
+    ex: /application/uid?count=100 批量获取，流式输出
     :param request:
     :return:
     """
-    resp_str = list()
     tpl_string = 'new uid is:{uu}, create time:{tt}\r\n'
-    for i in range(20):
-        uid = AppGlobalId.get_new_uid()
-        resp_str.append(tpl_string.format(uu=uid, tt='xxxoss'))
+    count = request.GET.get('count')
+    if count is None:
+        uid_list = AppGlobalId.get_new_uids(20)
+        resp_str = [tpl_string.format(uu=uid, tt='xxxoss') for uid in uid_list]
+        return HttpResponse(resp_str)
 
-    return HttpResponse(resp_str)
+    try:
+        count = int(count)
+    except ValueError:
+        count = 0
+    count = max(0, min(count, ApplicationConfig.UID_BATCH_MAX))
+    uid_list = AppGlobalId.get_new_uids(count)
+    return StreamingHttpResponse(tpl_string.format(uu=uid, tt='xxxoss') for uid in uid_list)
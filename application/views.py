@@ -1,5 +1,6 @@
 from django.shortcuts import render
 from django.http import HttpResponse
+from application.apps import ApplicationConfig
 
 def index(request):
     from awesome.config import myapps
@@ -14,10 +15,8 @@ def first(request):
 
 
 def get_one(request):
-    from application.app_models.models_userinfo import UserInfo
-    uinfo = list()
-    for i in range(1, 20):
-        uinfo.append(UserInfo.get_userinfo_byid(i))
+    from application.app_models.models_userinfo_cache import userinfo_cache
+    uinfo = userinfo_cache.get_userinfo_many(range(1, 20))
     return HttpResponse(uinfo)
 
 
@@ -50,7 +49,31 @@ def insert_one(request):
 
 
 def insert_all(request):
-    pass
+    from application.app_models.models_golbaluid import AppGlobalId
+    from application.app_models.models_userinfo import UserInfo
+    try:
+        count = int(request.GET.get('count', 100) or 0)
+    except ValueError:
+        count = 0
+    count = max(0, min(count, ApplicationConfig.UID_BATCH_MAX))
+    uid_list = AppGlobalId.get_new_uids(count)
+    if not uid_list:
+        ret = 'AppGlobalId.get_new_uids() None'
+        return HttpResponse(ret)
+
+    import random
+    rows = [
+        dict(
+            uid=uid,
+            nickname='人生若是如初见',
+            gender=random.randint(0, 2),
+            usersig='还是说说呵呵',
+            userarea='火星',
+        )
+        for uid in uid_list
+    ]
+    ret = UserInfo.insert_userinfo_many(rows)
+    return HttpResponse('%s rows ------ %s ok' % (len(rows), ret.count(True)))
 
 
 
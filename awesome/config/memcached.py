@@ -1,3 +1,17 @@
 # memcached 的配置
 
-mem_one = ['192.168.50.163', 11211]
\ No newline at end of file
+mem_one = ['192.168.50.163', 11211]
+
+# memcached 多节点的配置， [host, port, weight]
+# key 按 ketama 一致性哈希分布到各节点
+mem_cluster = [
+    ['192.168.50.163', 11211, 1],
+    ['192.168.50.163', 11212, 1],
+]
+
+# 进程内的 L1 缓存，None 不开启，参数见 config.redis.rd_local_cache
+# channel 使用 loader_redis.obj_rd_one 发布和订阅
+mem_local_cache = None
+
+# 过期时间随机增加的比例，0.1 为增加 0~10%，不超过 30 天
+mem_expire_jitter = 0
@@ -10,6 +10,22 @@ DB_PORT = 3306
 DB_USER = 'django'
 DB_PASSWORD = '123456'
 
+# 持久连接，连接保留的秒数，0 每个请求结束时关闭，None 不限时
+DB_CONN_MAX_AGE = 60
+# 复用持久连接前检查连接是否可用，不可用时重新连接
+DB_CONN_HEALTH_CHECKS = True
+
+# 连接池，线程/异步的 worker 共用少量连接，需要安装 django-db-connection-pool
+# 开启后 CONN_MAX_AGE 为 0，请求结束时连接归还到池中
+DB_POOL_ENABLED = False
+DB_POOL_ENGINE = 'dj_db_conn_pool.backends.mysql'
+DB_POOL_OPTIONS = {
+    'POOL_SIZE': 5,  # 池中保持的连接数
+    'MAX_OVERFLOW': 5,  # 超出 POOL_SIZE 后最多再建的连接数
+    'RECYCLE': 3600,  # 连接使用的最长秒数
+    'PRE_PING': True,  # 取出连接时检查是否可用
+}
+
 MYSQL_CONF = {
     'default': {
         'ENGINE': DB_ENGINE,
@@ -18,6 +34,8 @@ MYSQL_CONF = {
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     },
     'awesome_app': {
         'ENGINE': DB_ENGINE,
@@ -26,6 +44,8 @@ MYSQL_CONF = {
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     },
     'awesome_admin': {
         'ENGINE': DB_ENGINE,
@@ -34,6 +54,8 @@ MYSQL_CONF = {
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     },
     'awesome_data': {
         'ENGINE': DB_ENGINE,
@@ -42,9 +64,19 @@ MYSQL_CONF = {
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     },
 }
 
+if DB_POOL_ENABLED:
+    for db_conf in MYSQL_CONF.values():
+        db_conf.update(
+            ENGINE=DB_POOL_ENGINE,
+            CONN_MAX_AGE=0,
+            POOL_OPTIONS=dict(DB_POOL_OPTIONS),
+        )
+
 
 class DBRouterApp(helper_dbrouter.MultiMysqlRouter):
     APP_LABEL = 'application'
@@ -6,4 +6,25 @@ rd_one = ['192.168.50.163', 6379, 1]
 
 rd_two = ['192.168.50.163', 6379, 2]
 
-rd_three = ['192.168.50.163', 6379, 3]
\ No newline at end of file
+rd_three = ['192.168.50.163', 6379, 3]
+
+# 连接池的配置，同一个 host:port 的所有 db 共享一个连接池
+# health_check_interval 需要 redis-py >= 3.3
+rd_pool = dict(
+    max_connections=32,  # 每个 worker 进程到同一个 host:port 的最大连接数
+    timeout=5,  # 连接数已满时，等待空闲连接的秒数
+    socket_timeout=3,
+    socket_connect_timeout=1,
+    health_check_interval=30,  # 连接空闲超过该秒数，使用前先 PING
+)
+
+# 进程内的 L1 缓存，None 不开启
+# max_size: 每个实例最多缓存的 key 数量, ttl: 缓存的秒数
+# channel: 跨进程失效的 pub/sub 频道，None 时其他进程的 L1 最多 ttl 秒后过期
+# rd_local_cache = dict(max_size=1024, ttl=5, channel='awe_local_cache')
+rd_local_cache = None
+
+# 过期时间
+# expire_jitter: 过期时间随机增加的比例，0.1 为增加 0~10%，避免同时写入的 key 同时过期
+# touch_on_read: 读操作(hGet/hKeys/sMembers 等)是否发送 EXPIRE 刷新过期时间
+rd_expire = dict(expire_jitter=0, touch_on_read=True)
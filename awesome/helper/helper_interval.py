@@ -0,0 +1,53 @@
+"""
+awesome.helper
+区间索引帮助类
+"""
+import bisect
+
+
+class IntervalIndex:
+    """
+    闭区间的集合，合并为有序、不相交的区间，二分查找
+    用于判断一个ID是否在保留的ID/区间中，以及查找下一个不在区间中的ID
+    """
+
+    def __init__(self, ids=None, ranges=None):
+        """
+        ids: 单个的ID [2, 4, 5]
+        ranges: 闭区间 [(100, 199), (1000, 1999)]
+        """
+        intervals = [(int(i), int(i)) for i in (ids or ())]
+        intervals += [(int(start), int(end)) for start, end in (ranges or ()) if start <= end]
+        intervals.sort()
+
+        # 合并重叠或相邻的区间
+        merged = list()
+        for start, end in intervals:
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, value):
+        """
+        value 是否在某个区间中
+        """
+        index = bisect.bisect_right(self.starts, value) - 1
+        return index >= 0 and value <= self.ends[index]
+
+    def next_free(self, value):
+        """
+        不小于 value 且不在任何区间中的最小值
+        区间已合并，不相邻，所以最多跳过一个区间
+        """
+        index = bisect.bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.ends[index] + 1
+        return value
@@ -2,7 +2,14 @@
 awesome.helper
 Mysql 帮助类
 """
+import os
 import sys
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import django
+from django.core.signals import request_started
+from django.db import connections
 
 
 def gen_multi_model(cls):
@@ -67,3 +74,168 @@ def namedtuplefetchall(cursor):
     desc = cursor.description
     nt_result = namedtuple('Result', [col[0] for col in desc])
     return [nt_result(*row) for row in cursor.fetchall()]
+
+
+def close_unusable_connections(**kwargs):
+    """
+    请求开始时检查复用的持久连接，不可用(MySQL 重启、wait_timeout 断开)就关闭，
+    执行查询时重新连接
+    """
+    for conn in connections.all():
+        if conn.connection is None or not conn.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not conn.is_usable():
+            conn.close()
+
+
+def enable_health_checks():
+    """
+    Django 4.1 起 CONN_HEALTH_CHECKS 由 Django 处理，之前的版本在 request_started 时检查
+    """
+    if django.VERSION < (4, 1):
+        request_started.connect(close_unusable_connections,
+                                dispatch_uid='helper_mysql.close_unusable_connections')
+
+
+@contextmanager
+def db_cursor(using='default'):
+    """
+    在当前线程的连接上取一个游标，用完关闭
+    Django 的连接按线程隔离，请求结束时由 request_finished 按 CONN_MAX_AGE 关闭或保留，
+    不要在模块级别创建游标，多个线程会共用一个连接
+    with db_cursor('awesome_app') as cursor:
+        cursor.execute(sql, params)
+    """
+    cursor = connections[using].cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+# scatter_gather 共用的常驻线程池，{线程数: ThreadPoolExecutor}
+_executors = dict()
+_executors_lock = threading.Lock()
+_executors_pid = None
+
+
+def get_executor(max_workers):
+    """
+    scatter_gather 共用的常驻线程池，每种线程数一个
+    线程常驻，线程中的数据库连接跨调用复用，不用每次查询都重新连接；
+    fork 出的子进程不能使用父进程的线程，重新创建
+    """
+    global _executors_pid
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='scatter-gather')
+        return executor
+
+
+def fetch_thread_rows(using, sql, params=None):
+    """
+    在 scatter_gather 的线程池中查询，使用本线程自己的数据库连接
+    线程池中的线程不经过 request_started/request_finished，这里按相同的规则处理连接：
+    查询前关闭超过 CONN_MAX_AGE 或出错的连接，CONN_MAX_AGE=0 时查询完关闭
+    """
+    connection = connections[using]
+    connection.close_if_unusable_or_obsolete()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dictfetchall(cursor)
+    finally:
+        if connection.settings_dict.get('CONN_MAX_AGE', 0) == 0:
+            connection.close()
+
+
+def scatter_gather(sql_list, using='default', max_workers=4, order_by=None, reverse=False, limit=None):
+    """
+    多条查询(一般是每个分表一条)并发执行，合并结果
+    :param sql_list: [(sql, params), ...]
+    :param using: 数据库别名
+    :param max_workers: 并发线程数，<=1 时在当前线程中依次执行
+    :param order_by: 合并后排序的字段
+    :param reverse: 是否倒序
+    :param limit: 合并后最多返回的行数
+    :return: dict 的列表
+    """
+    if not sql_list:
+        return list()
+
+    if max_workers <= 1 or len(sql_list) == 1:
+        rows_list = list()
+        with connections[using].cursor() as cursor:
+            for sql, params in sql_list:
+                cursor.execute(sql, params)
+                rows_list.append(dictfetchall(cursor))
+    else:
+        executor = get_executor(max_workers)
+        rows_list = list(executor.map(lambda item: fetch_thread_rows(using, *item), sql_list))
+
+    rows = [row for shard_rows in rows_list for row in shard_rows]
+    if order_by:
+        rows.sort(key=lambda row: row[order_by], reverse=reverse)
+    if limit is not None:
+        rows = rows[:limit]
+    return rows
+
+
+class StatementCache:
+    """
+    参数化SQL的缓存，按 (操作, 表名) 生成一次SQL，执行时绑定参数
+    驱动支持服务端预处理语句时(mysql-connector-python 的 cursor(prepared=True))，
+    每个线程、每个连接、每条SQL 复用一个预处理游标，只 PREPARE 一次；
+    mysqlclient(MySQLdb) 不支持，在客户端绑定参数
+    """
+
+    def __init__(self, templates):
+        """
+        templates: {操作: SQL模板}，模板中的 {table} 替换为表名，参数用 %s
+        """
+        self.templates = templates
+        self.statements = dict()
+        self.local = threading.local()
+
+    def get(self, operation, table_name):
+        """
+        参数化的SQL
+        """
+        key = (operation, table_name)
+        sql = self.statements.get(key)
+        if sql is None:
+            sql = self.statements[key] = self.templates[operation].format(table=table_name)
+        return sql
+
+    def prepared_cursor(self, cursor, key):
+        """
+        当前连接的预处理游标，驱动不支持时返回 None
+        """
+        db = getattr(cursor, 'db', None)
+        raw = getattr(db, 'connection', None)
+        if raw is None or not type(raw).__module__.startswith('mysql.connector'):
+            return None
+
+        cursors = getattr(self.local, 'cursors', None)
+        if cursors is None or self.local.raw is not raw:
+            # 连接变了，之前的预处理语句已失效
+            cursors = self.local.cursors = dict()
+            self.local.raw = raw
+        if key not in cursors:
+            cursors[key] = raw.cursor(prepared=True)
+        return cursors[key]
+
+    def execute(self, cursor, operation, table_name, params=None):
+        """
+        执行缓存的SQL
+        :return: 执行用的游标，从它读取结果
+        """
+        sql = self.get(operation, table_name)
+        cursor = self.prepared_cursor(cursor, (operation, table_name)) or cursor
+        cursor.execute(sql, params)
+        return cursor
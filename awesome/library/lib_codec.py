@@ -0,0 +1,207 @@
+"""
+缓存值的编解码
+
+序列化： json / msgpack / pickle
+压缩： 序列化后超过 compress_threshold 字节时使用 zlib / lz4 压缩
+编码后的第一个字节为 MAGIC，第二个字节为标记位，低 4 位为序列化方式，高 4 位为压缩方式，
+解码时按标记位处理，修改配置后旧数据仍然可以读取。
+没有 MAGIC 或标记位无效的数据(开启 codec 之前写入的值、滚动发布期间旧版本写入的值)
+按未编码的数据原样返回，utf-8 的按 str 返回。
+"""
+import json
+import pickle
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# 编码后数据的第一个字节，utf-8 文本中不会出现 0xFE
+MAGIC = 0xFE
+
+# 序列化方式， 标记位的低 4 位
+SERIALIZER_BYTES = 0  # bytes 原样存储
+SERIALIZER_STR = 1  # str 按 utf-8 存储
+SERIALIZER_JSON = 2
+SERIALIZER_MSGPACK = 3
+SERIALIZER_PICKLE = 4
+
+# 压缩方式， 标记位的高 4 位
+COMPRESSOR_NONE = 0
+COMPRESSOR_ZLIB = 1
+COMPRESSOR_LZ4 = 2
+
+SERIALIZER_NAMES = {
+    'json': SERIALIZER_JSON,
+    'msgpack': SERIALIZER_MSGPACK,
+    'pickle': SERIALIZER_PICKLE,
+}
+
+SERIALIZER_FLAGS = {SERIALIZER_BYTES, SERIALIZER_STR, SERIALIZER_JSON, SERIALIZER_MSGPACK,
+                    SERIALIZER_PICKLE}
+
+COMPRESSOR_FLAGS = {COMPRESSOR_NONE, COMPRESSOR_ZLIB, COMPRESSOR_LZ4}
+
+COMPRESSOR_NAMES = {
+    None: COMPRESSOR_NONE,
+    'zlib': COMPRESSOR_ZLIB,
+    'lz4': COMPRESSOR_LZ4,
+}
+
+
+class Codec:
+
+    # 序列化后超过该字节数才压缩
+    DEFAULT_COMPRESS_THRESHOLD = 1024
+
+
+    def __init__(self, serializer='json', compressor='zlib', compress_threshold=None,
+                 compress_level=6):
+        """
+        初始化
+        serializer: json / msgpack / pickle
+        compressor: zlib / lz4 / None 不压缩
+        compress_threshold: 序列化后超过该字节数才压缩
+        """
+        if serializer not in SERIALIZER_NAMES:
+            raise ValueError('unknown serializer: %s' % serializer)
+        if compressor not in COMPRESSOR_NAMES:
+            raise ValueError('unknown compressor: %s' % compressor)
+        if serializer == 'msgpack' and msgpack is None:
+            raise ValueError('serializer msgpack requires the msgpack package')
+        if compressor == 'lz4' and lz4_frame is None:
+            raise ValueError('compressor lz4 requires the lz4 package')
+
+        self.serializer = SERIALIZER_NAMES[serializer]
+        self.compressor = COMPRESSOR_NAMES[compressor]
+        if compress_threshold is None:
+            compress_threshold = self.DEFAULT_COMPRESS_THRESHOLD
+        self.compress_threshold = int(compress_threshold)
+        self.compress_level = compress_level
+
+
+    def serialize(self, value):
+        """
+        序列化， return: (序列化方式, bytes)
+        bytes 和 str 不经过序列化
+        """
+        if isinstance(value, bytes):
+            return SERIALIZER_BYTES, value
+        if isinstance(value, str):
+            return SERIALIZER_STR, value.encode('utf-8')
+
+        if self.serializer == SERIALIZER_JSON:
+            data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        elif self.serializer == SERIALIZER_MSGPACK:
+            data = msgpack.packb(value, use_bin_type=True)
+        else:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        return self.serializer, data
+
+
+    @staticmethod
+    def deserialize(serializer, data):
+        """
+        按序列化方式还原
+        """
+        if serializer == SERIALIZER_BYTES:
+            return data
+        if serializer == SERIALIZER_STR:
+            return data.decode('utf-8')
+        if serializer == SERIALIZER_JSON:
+            return json.loads(data.decode('utf-8'))
+        if serializer == SERIALIZER_MSGPACK:
+            return msgpack.unpackb(data, raw=False)
+        if serializer == SERIALIZER_PICKLE:
+            return pickle.loads(data)
+
+        raise ValueError('unknown serializer flag: %s' % serializer)
+
+
+    def compress(self, data):
+        """
+        超过阈值时压缩，压缩后没有变小则不压缩
+        return: (压缩方式, bytes)
+        """
+        if self.compressor == COMPRESSOR_NONE or len(data) <= self.compress_threshold:
+            return COMPRESSOR_NONE, data
+
+        if self.compressor == COMPRESSOR_ZLIB:
+            compressed = zlib.compress(data, self.compress_level)
+        else:
+            compressed = lz4_frame.compress(data)
+
+        if len(compressed) >= len(data):
+            return COMPRESSOR_NONE, data
+        return self.compressor, compressed
+
+
+    @staticmethod
+    def decompress(compressor, data):
+        """
+        按压缩方式解压
+        """
+        if compressor == COMPRESSOR_NONE:
+            return data
+        if compressor == COMPRESSOR_ZLIB:
+            return zlib.decompress(data)
+        if compressor == COMPRESSOR_LZ4:
+            if lz4_frame is None:
+                raise ValueError('value compressed with lz4 but the lz4 package is missing')
+            return lz4_frame.decompress(data)
+
+        raise ValueError('unknown compressor flag: %s' % compressor)
+
+
+    def dumps(self, value):
+        """
+        编码： MAGIC + 标记位 + 序列化(压缩)后的数据
+        """
+        serializer, data = self.serialize(value)
+        compressor, data = self.compress(data)
+        return bytes((MAGIC, compressor << 4 | serializer)) + data
+
+
+    def loads(self, data):
+        """
+        解码， None 返回 None
+        不是本 codec 编码的数据原样返回，不抛出异常
+        """
+        if data is None:
+            return None
+        if isinstance(data, str):
+            # 客户端已经解码为 str，不是 codec 编码的数据
+            return data
+        if not data:
+            return None
+
+        if len(data) < 2 or data[0] != MAGIC:
+            return self.raw(data)
+        compressor, serializer = data[1] >> 4, data[1] & 0x0F
+        if compressor not in COMPRESSOR_FLAGS or serializer not in SERIALIZER_FLAGS:
+            return self.raw(data)
+
+        try:
+            return self.deserialize(serializer, self.decompress(compressor, data[2:]))
+        except Exception:
+            # 数据损坏、缺少 lz4/msgpack 等，按未编码的数据返回
+            return self.raw(data)
+
+
+    @staticmethod
+    def raw(data):
+        """
+        未编码的数据，utf-8 的转为 str，和不使用 codec 时 get 的返回一致
+        """
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data
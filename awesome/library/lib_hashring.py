@@ -0,0 +1,100 @@
+"""
+ketama 一致性哈希环
+
+每个节点按权重在环上放置多个虚拟点，key 落在顺时针方向的第一个虚拟点所属的节点。
+增加或删除一个节点时，只有大约 1/N 的 key 需要重新分布。
+"""
+import bisect
+import hashlib
+import threading
+
+
+class HashRing:
+
+    # 每个权重单位对应的 md5 次数，每次 md5 生成 4 个虚拟点，与 libketama 一致
+    POINTS_PER_WEIGHT = 40
+
+
+    def __init__(self, nodes=None):
+        """
+        初始化
+        nodes: {节点名: 权重}
+        """
+        # 节点名 -> 权重
+        self.nodes = dict()
+        # 有序的虚拟点哈希值，和对应的节点名
+        self.points = list()
+        self.point_nodes = list()
+        self.lock = threading.Lock()
+
+        for node, weight in (nodes or dict()).items():
+            self.nodes[node] = max(1, int(weight or 1))
+        self.build()
+
+
+    @staticmethod
+    def hash_digest(key):
+        """
+        key 的 md5 摘要
+        """
+        return hashlib.md5(str(key).encode('utf-8')).digest()
+
+
+    @classmethod
+    def hash_key(cls, key):
+        """
+        key 在环上的位置，取 md5 的前 4 个字节
+        """
+        digest = cls.hash_digest(key)
+        return digest[3] << 24 | digest[2] << 16 | digest[1] << 8 | digest[0]
+
+
+    def build(self):
+        """
+        重新生成所有虚拟点
+        """
+        ring = list()
+        for node, weight in self.nodes.items():
+            for i in range(weight * self.POINTS_PER_WEIGHT):
+                digest = self.hash_digest('%s-%s' % (node, i))
+                # 一次 md5 的 16 个字节生成 4 个虚拟点
+                for j in range(4):
+                    point = (digest[3 + j * 4] << 24 | digest[2 + j * 4] << 16
+                             | digest[1 + j * 4] << 8 | digest[j * 4])
+                    ring.append((point, node))
+        ring.sort()
+
+        with self.lock:
+            self.points = [point for point, _ in ring]
+            self.point_nodes = [node for _, node in ring]
+
+
+    def add_node(self, node, weight=1):
+        """
+        增加节点
+        """
+        self.nodes[node] = max(1, int(weight or 1))
+        self.build()
+
+
+    def remove_node(self, node):
+        """
+        删除节点
+        """
+        self.nodes.pop(node, None)
+        self.build()
+
+
+    def get_node(self, key):
+        """
+        key 所属的节点，环为空时返回 None
+        """
+        with self.lock:
+            points, point_nodes = self.points, self.point_nodes
+        if not points:
+            return None
+
+        index = bisect.bisect(points, self.hash_key(key))
+        if index == len(points):
+            index = 0
+        return point_nodes[index]
@@ -0,0 +1,239 @@
+"""
+进程内的 L1 缓存
+
+放在 Redis/Memcached 前面，热点 key 在进程内存中保留很短的时间，读取时不再走网络。
+容量有上限，超出时淘汰最久未使用的 key(LRU)，每个 key 的过期时间很短(TTL)。
+写操作只清除本进程的 L1，其他进程的 L1 最多在 TTL 后过期；
+需要立即清除时，写操作把 key 发布到 Redis 频道，各进程订阅后清除。
+"""
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 已创建的 L1 缓存，{名称: LocalCache}，用于监控
+_registry = dict()
+_registry_lock = threading.Lock()
+
+# get 未命中时的默认返回，区分缓存的 None
+MISSING = object()
+
+# 不可变的值，缓存和读取时不用复制
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def copy_value(value):
+    """
+    dict/list 等可变的值，缓存和返回的都是副本，调用方修改返回值不影响缓存
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+    return copy.deepcopy(value)
+
+
+class LocalCache:
+    """
+    线程安全的 LRU + TTL 缓存
+    """
+
+    def __init__(self, name=None, max_size=1024, ttl=5):
+        """
+        name: 名称，见 local_cache_stats
+        max_size: 最多缓存的 key 数量
+        ttl: 每个 key 缓存的秒数
+        """
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        # {key: (过期时间, 值)}，按最近使用排序
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.counter = dict(hit=0, miss=0, evict=0, expire=0, invalidate=0)
+        # 正在 get_or_load 的 key，{key: [读取中的线程数, 读取期间清除的次数]}
+        self.loading = dict()
+        # 发布失效消息的 redis 连接和频道
+        self.obj_publish = None
+        self.channel = None
+        # 消息的来源，订阅时忽略自己发布的消息
+        self.node_id = '%s:%s' % (os.getpid(), id(self))
+
+        if name:
+            with _registry_lock:
+                _registry[name] = self
+
+
+    def get(self, key, default=MISSING):
+        """
+        缓存的值，不存在或已过期返回 default
+        """
+        now = time.monotonic()
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.counter['miss'] += 1
+                return default
+            if item[0] <= now:
+                del self.items[key]
+                self.counter['expire'] += 1
+                self.counter['miss'] += 1
+                return default
+            self.items.move_to_end(key)
+            self.counter['hit'] += 1
+            value = item[1]
+        return copy_value(value)
+
+
+    def set(self, key, value, ttl=None):
+        """
+        缓存 key，超出容量时淘汰最久未使用的 key
+        """
+        value = copy_value(value)
+        with self.lock:
+            self._store(key, value, ttl)
+
+
+    def _store(self, key, value, ttl=None):
+        """
+        set 的实现，调用时已持有 self.lock
+        """
+        self.items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.counter['evict'] += 1
+
+
+    def get_or_load(self, key, loader):
+        """
+        缓存的值，未命中时调用 loader() 读取并缓存
+        读取期间 key 被清除(delete/invalidate/clear)时，读到的可能是清除前的旧值，只返回不缓存
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        with self.lock:
+            loading = self.loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        value = stored = MISSING
+        try:
+            value = loader()
+            stored = copy_value(value)
+        finally:
+            with self.lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self.loading[key]
+                if stored is not MISSING and loading[1] == generation:
+                    self._store(key, stored)
+        return value
+
+
+    def delete(self, *keys):
+        """
+        清除本进程的 key
+        """
+        with self.lock:
+            for key in keys:
+                if self.items.pop(key, None) is not None:
+                    self.counter['invalidate'] += 1
+                if key in self.loading:
+                    self.loading[key][1] += 1
+
+
+    def invalidate(self, *keys):
+        """
+        写操作后清除 key，开启了 pub/sub 时通知其他进程
+        """
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        self.delete(*keys)
+        if self.obj_publish is not None:
+            for key in keys:
+                self.obj_publish.publish(self.channel, '%s %s' % (self.node_id, key))
+
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            for loading in self.loading.values():
+                loading[1] += 1
+
+
+    def stats(self):
+        """
+        命中/未命中计数和命中率
+        """
+        with self.lock:
+            stats = dict(self.counter)
+            stats['size'] = len(self.items)
+        total = stats['hit'] + stats['miss']
+        stats['max_size'] = self.max_size
+        stats['hit_ratio'] = stats['hit'] / total if total else 0.0
+        return stats
+
+
+    def enable_pubsub(self, obj_redis, channel):
+        """
+        开启跨进程失效
+        invalidate 时 PUBLISH 到 channel，后台线程 SUBSCRIBE channel，收到的 key 从本进程清除
+        obj_redis: redis-py 的 StrictRedis
+        """
+        self.obj_publish = obj_redis
+        self.channel = channel
+        thread = threading.Thread(target=self.listen, args=(obj_redis, channel),
+                                  name='local-cache-%s' % (self.name or channel))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+    def listen(self, obj_redis, channel):
+        """
+        订阅失效消息，消息为 "node_id key"
+        连接断开时清空 L1(期间的消息已丢失)，稍后重新订阅
+        """
+        from redis import RedisError
+        while True:
+            try:
+                pubsub = obj_redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    data = message['data']
+                    node_id, _, key = (bytes.decode(data) if isinstance(data, bytes) else data).partition(' ')
+                    if node_id != self.node_id:
+                        self.delete(key)
+            except RedisError:
+                self.clear()
+                time.sleep(1)
+
+
+def make_local_cache(name, conf=None, obj_redis=None):
+    """
+    根据配置创建 L1 缓存，没有配置时返回 None
+    conf: dict(max_size=1024, ttl=5, channel=None)
+    obj_redis: channel 不为空时，发布和订阅失效消息的 StrictRedis
+    """
+    if not conf:
+        return None
+
+    conf = dict(conf)
+    channel = conf.pop('channel', None)
+    local_cache = LocalCache(name=name, **conf)
+    if channel and obj_redis is not None:
+        local_cache.enable_pubsub(obj_redis, channel)
+    return local_cache
+
+
+def local_cache_stats():
+    """
+    所有 L1 缓存的统计，用于监控
+    """
+    with _registry_lock:
+        registry = dict(_registry)
+    return {name: local_cache.stats() for name, local_cache in registry.items()}
@@ -3,7 +3,11 @@
  Memcached是一种基于内存的key-value存储，用来存储小块的任意数据（字符串、对象）。
  Memcached是一个简洁的key-value存储系统。
 """
+import random
+import uuid
 import memcache
+from awesome.library import lib_stampede
+from awesome.library.lib_hashring import HashRing
 
 
 class LibMemcached:
@@ -14,22 +18,109 @@ class LibMemcached:
     # memcached 连接对象
     obj_memcached = None
 
+    # 多节点时，一致性哈希环 和 {节点名: memcached 连接对象}
+    hash_ring = None
+    obj_clients = None
+
     # 默认的过期时间为30天
     DEFAULT_EXPIRE = 2592000;
 
+    # 过期时间随机增加的比例，0.1 为增加 0~10%，避免同时写入的 key 同时过期
+    expire_jitter = 0
+
+    # 值的编解码，见 lib_codec.Codec
+    codec = None
+
+    # 进程内的 L1 缓存，见 lib_local_cache.LocalCache
+    # 只缓存 get 的结果，本实例的写操作会清除对应的 key
+    local_cache = None
 
-    def __init__(self, host='127.0.0.1', port=11211, prefix=None, debug=False):
+
+    def __init__(self, host='127.0.0.1', port=11211, prefix=None, debug=False, servers=None,
+                 codec=None, local_cache=None, expire_jitter=0):
         """
         初始化
+        servers: 多节点 [[host, port, weight], ...]，key 按 ketama 一致性哈希分布到各节点
+                 设置了 servers 时忽略 host 和 port
+        codec: 值的序列化和压缩，lib_codec.Codec 实例，作用于 set/get/set_multi/get_multi
+               编码后是二进制数据，不能再使用 append/prepend
+        local_cache: 进程内的 L1 缓存，lib_local_cache.LocalCache 实例
+        expire_jitter: 过期时间随机增加的比例
         """
+        if prefix:
+           self.key_prefix = prefix.strip()
+        self.debug = debug
+        self.codec = codec
+        self.local_cache = local_cache
+        self.expire_jitter = float(expire_jitter or 0)
+
+        if servers:
+            self.hash_ring = HashRing()
+            self.obj_clients = dict()
+            for server in servers:
+                self.add_server(*server)
+            return None
+
         if not host or not port:
             return None
         server = '%s:%s'%(host, port)
 
-        if prefix:
-           self.key_prefix = prefix.strip()
+        # cache_cas: gets 记录 CAS 值，cas 才会比较，见 get_or_compute 的 unlock
+        self.obj_memcached = memcache.Client([server], debug=debug, cache_cas=True)
 
-        self.obj_memcached = memcache.Client([server], debug=debug)
+
+    def add_server(self, host, port, weight=1):
+        """
+        多节点时增加节点，大约 1/N 的 key 会分布到新节点
+        """
+        if self.hash_ring is None:
+            return None
+
+        server = '%s:%s'%(host, port)
+        self.obj_clients[server] = memcache.Client([server], debug=self.debug, cache_cas=True)
+        self.hash_ring.add_node(server, weight)
+        return True
+
+
+    def remove_server(self, host, port):
+        """
+        多节点时删除节点，只有该节点上的 key 重新分布
+        """
+        if self.hash_ring is None:
+            return None
+
+        server = '%s:%s'%(host, port)
+        self.hash_ring.remove_node(server)
+        obj_client = self.obj_clients.pop(server, None)
+        if obj_client is not None:
+            obj_client.disconnect_all()
+        return True
+
+
+    def get_client(self, keyname):
+        """
+        处理后的 keyname 所在节点的连接对象
+        """
+        if self.hash_ring is None:
+            return self.obj_memcached
+
+        return self.obj_clients.get(self.hash_ring.get_node(keyname))
+
+
+    def group_keys(self, keys):
+        """
+        按所在节点把处理后的 key 分组
+        return: [(连接对象, [key, ...])]
+        """
+        if self.hash_ring is None:
+            return [(self.obj_memcached, list(keys))]
+
+        groups = dict()
+        for key in keys:
+            node = self.hash_ring.get_node(self.key_prefix + key)
+            groups.setdefault(node, list()).append(key)
+
+        return [(self.obj_clients[node], node_keys) for node, node_keys in groups.items()]
 
 
     def key_make(self, key=None):
@@ -55,25 +146,66 @@ class LibMemcached:
         if isinstance(value, str):
             value = value.strip()
 
-        # 过期时间
-        if expire is None:
-            set_expire = self.DEFAULT_EXPIRE
-        else:
-            expire = int(expire)
-            set_expire = expire if expire<self.DEFAULT_EXPIRE else self.DEFAULT_EXPIRE
+        keyname = self.key_make(key)
+        value = self.value_dump(value)
+        ret = self.get_client(keyname).set(keyname, value, self.expire_make(expire))
+        self.local_invalidate(keyname)
+        return ret
+
+
+    def expire_make(self, expire=None):
+        """
+        过期时间，默认且最大为 DEFAULT_EXPIRE，加上 expire_jitter 比例的随机秒数
+        0 为不过期
+        超过 30 天时 memcached 会当作时间戳，所以不能超过 DEFAULT_EXPIRE
+        """
+        expire = self.DEFAULT_EXPIRE if expire is None else int(expire)
+        if expire > 0 and self.expire_jitter:
+            expire += random.randint(0, int(expire * self.expire_jitter))
+        return expire if expire<self.DEFAULT_EXPIRE else self.DEFAULT_EXPIRE
+
+
+    def value_dump(self, value):
+        """
+        存储的值，设置了 codec 时使用 codec 编码
+        """
+        if self.codec is None:
+            return value
+
+        return self.codec.dumps(value)
+
 
-        return self.obj_memcached.set(self.key_make(key), value, set_expire)
+    def value_load(self, value):
+        """
+        读取的值，设置了 codec 时使用 codec 解码
+        """
+        if self.codec is None or value is None:
+            return value
+
+        return self.codec.loads(value)
+
+
+    def local_invalidate(self, *keynames):
+        """
+        写操作之后清除 L1 缓存中的 key
+        """
+        if self.local_cache is not None:
+            self.local_cache.invalidate(*keynames)
 
 
     def get(self, key=None):
         """
         获取以key作为key存储的元素存储的值
+        设置了 local_cache 时先读 L1 缓存
         """
         if not key:
             return None
 
-        key = str(key).strip()
-        return self.obj_memcached.get(self.key_make(key))
+        keyname = self.key_make(str(key).strip())
+        if self.local_cache is not None:
+            return self.local_cache.get_or_load(
+                keyname, lambda: self.value_load(self.get_client(keyname).get(keyname)))
+        return self.value_load(self.get_client(keyname).get(keyname))
 
 
     def delete(self, key=None):
@@ -83,8 +215,10 @@ class LibMemcached:
         if not key:
             return None
 
-        key = str(key).strip()
-        return self.obj_memcached.delete(self.key_make(key))
+        keyname = self.key_make(str(key).strip())
+        ret = self.get_client(keyname).delete(keyname)
+        self.local_invalidate(keyname)
+        return ret
 
 
     def prepend(self, key=None, value=None):
@@ -98,7 +232,10 @@ class LibMemcached:
         if isinstance(value, str):
             value = value.strip()
 
-        return self.obj_memcached.prepend(self.key_make(key), value)
+        keyname = self.key_make(key)
+        ret = self.get_client(keyname).prepend(keyname, value)
+        self.local_invalidate(keyname)
+        return ret
 
 
     def append(self, key=None, value=None):
@@ -112,4 +249,119 @@ class LibMemcached:
         if isinstance(value, str):
             value = value.strip()
 
-        return self.obj_memcached.append(self.key_make(key), value)
+        keyname = self.key_make(key)
+        ret = self.get_client(keyname).append(keyname, value)
+        self.local_invalidate(keyname)
+        return ret
+
+
+    def get_multi(self, keys=None):
+        """
+        一次获取多个key的值
+        返回 {key: value}，key 为调用时传入的原始key，不存在的key不返回
+        """
+        if not keys:
+            return None
+
+        # (原始key, 处理后的key)
+        key_pairs = [(key, str(key).strip()) for key in keys if key and str(key).strip()]
+        if not key_pairs:
+            return None
+
+        result = dict()
+        for obj_client, node_keys in self.group_keys({k for _, k in key_pairs}):
+            result.update(obj_client.get_multi(node_keys, key_prefix=self.key_prefix))
+        return {key: self.value_load(result[k]) for key, k in key_pairs if k in result}
+
+
+    def set_multi(self, mapping=None, expire=None):
+        """
+        一次存储多个元素，{key: value}
+        字符串和数值直接存储，其他类型序列化后存储
+        返回存储失败的key列表，全部成功返回空列表
+        """
+        if not mapping or not isinstance(mapping, dict):
+            return None
+
+        key_map = dict()
+        set_mapping = dict()
+        for key, value in mapping.items():
+            if not key or value is None or not str(key).strip():
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            key_map[str(key).strip()] = key
+            set_mapping[str(key).strip()] = self.value_dump(value)
+        if not set_mapping:
+            return None
+
+        failed_keys = list()
+        for obj_client, node_keys in self.group_keys(set_mapping):
+            failed_keys.extend(obj_client.set_multi({k: set_mapping[k] for k in node_keys},
+                                                    self.expire_make(expire),
+                                                    key_prefix=self.key_prefix))
+        self.local_invalidate(*[self.key_prefix + k for k in set_mapping])
+        return [key_map.get(k, k) for k in failed_keys]
+
+
+    def delete_multi(self, keys=None):
+        """
+        一次删除多个key
+        全部删除成功返回 1
+        """
+        if not keys:
+            return None
+
+        keys = [str(k).strip() for k in keys if k and str(k).strip()]
+        if not keys:
+            return None
+
+        ret_flag = 1
+        for obj_client, node_keys in self.group_keys(keys):
+            if not obj_client.delete_multi(node_keys, key_prefix=self.key_prefix):
+                ret_flag = 0
+        self.local_invalidate(*[self.key_prefix + k for k in keys])
+        return ret_flag
+
+
+    def get_or_compute(self, key=None, fn=None, ttl=None, beta=1.0, lock_timeout=10,
+                       wait=0.5, stale_ttl=300):
+        """
+        读取缓存，不存在或需要刷新时调用 fn() 计算并缓存，见 lib_stampede
+        只有抢到锁(ADD)的进程计算，其他进程返回旧值，没有旧值时最多等待 wait 秒
+        XFetch 提前刷新，过期时间被随机打散
+        ttl: 逻辑过期秒数，默认且最大为 DEFAULT_EXPIRE - stale_ttl，给旧值留出 stale_ttl
+        lock_timeout: 锁的秒数，应大于 fn() 的耗时
+        stale_ttl: 逻辑过期后旧值再保留的秒数，刷新期间返回旧值
+        """
+        if not key or fn is None:
+            return None
+
+        keyname = self.key_make(str(key).strip())
+        lock_key = keyname + ':lock'
+        # 逻辑过期时间不加随机秒数(XFetch 已经打散)，只在写入 memcached 时加一次
+        stale_ttl = int(stale_ttl)
+        ttl = min(int(ttl or self.DEFAULT_EXPIRE), self.DEFAULT_EXPIRE - stale_ttl)
+
+        def load():
+            return self.value_load(self.get_client(keyname).get(keyname))
+
+        def store(envelope):
+            self.get_client(keyname).set(keyname, self.value_dump(envelope),
+                                         self.expire_make(ttl + stale_ttl))
+
+        def lock():
+            token = uuid.uuid4().hex
+            return token if self.get_client(lock_key).add(lock_key, token, lock_timeout) else None
+
+        def unlock(token):
+            # gets/cas 比较并删除：锁过期后被其他进程抢到时 cas 失败，不会删除别人的锁
+            # memcached 没有带 CAS 的 delete，cas 写入一个立即过期(负的过期时间)的值
+            obj_client = self.get_client(lock_key)
+            try:
+                if obj_client.gets(lock_key) == token:
+                    obj_client.cas(lock_key, '', -1)
+            finally:
+                obj_client.reset_cas()
+
+        return lib_stampede.get_or_compute(load, store, lock, unlock, fn, ttl, beta=beta, wait=wait)
@@ -10,25 +10,343 @@ Redis读的速度是110000次/s,写的速度是81000次/s
 Redis的所有操作都是原子性的，同时Redis还支持对几个操作全并后的原子性执行。
 
 """
+import copy
 import functools
+import hashlib
+import json
+import random
+import time
+import uuid
 from redis import StrictRedis
+from redis.exceptions import NoScriptError
+from awesome.library import lib_stampede
 
 
 def wraps_set_expire(func):
     """
-    装饰器， 设置key默认过期时间
+    装饰器， 写操作之后设置key的过期时间
+    调用时可以传入 expire： 过期秒数，默认 DEFAULT_EXPIRE；False 不修改过期时间
+    注意 SET 本身会清除原有的过期时间，set(expire=False) 之后 key 不再过期
+    """
+    return wraps_expire(func, is_read=False)
+
+
+def wraps_touch_expire(func):
+    """
+    装饰器， 读操作之后刷新key的过期时间
+    touch_on_read=False 时默认不刷新，调用时传入 expire 仍然刷新
+    """
+    return wraps_expire(func, is_read=True)
+
+
+def wraps_expire(func, is_read=False):
+    """
+    wraps_set_expire 和 wraps_touch_expire 的实现
     """
     @functools.wraps(func)
-    def wrapper_func(self, keyname, *args, **kwargs):
+    def wrapper_func(self, keyname, *args, expire=None, **kwargs):
+        if expire is None and is_read and not self.touch_on_read:
+            expire = False
+        if expire is not None and not expire:
+            # 不修改过期时间，不发送 EXPIRE
+            return func(self, keyname, *args, **kwargs)
+
+        if self.expire_in_pipeline:
+            # 命令和 EXPIRE 合并到一次网络往返
+            # 浅拷贝实例，避免多线程共享实例时相互替换连接对象
+            obj_lib = copy.copy(self)
+            obj_lib.obj_redis = ExpirePipeline(self.obj_redis,
+                                               self.key_make(keyname),
+                                               self.expire_make(expire))
+            return func(obj_lib, keyname, *args, **kwargs)
+
         ret_func = func(self, keyname, *args, **kwargs)
         # 设置key的过期时间
         if ret_func is not None:
-            self.set_expire(keyname)
+            self.set_expire(keyname, expire)
         return ret_func
 
     return wrapper_func
 
 
+def wraps_local_cache(func):
+    """
+    装饰器， 设置了 local_cache 时先读进程内的 L1 缓存，未命中再读 redis
+    在 wraps_set_expire 外层，L1 命中时不发送 EXPIRE
+    """
+    @functools.wraps(func)
+    def wrapper_func(self, keyname=None, *args, **kwargs):
+        if self.local_cache is None or not self.local_read or not keyname:
+            return func(self, keyname, *args, **kwargs)
+
+        return self.local_cache.get_or_load(self.key_make(keyname.strip()),
+                                            lambda: func(self, keyname, *args, **kwargs))
+
+    return wrapper_func
+
+
+def wraps_local_invalidate(func):
+    """
+    装饰器， 写操作之后清除 L1 缓存中的 key，pipeline 中在 execute 之后清除
+    """
+    @functools.wraps(func)
+    def wrapper_func(self, keyname=None, *args, **kwargs):
+        ret_func = func(self, keyname, *args, **kwargs)
+        if keyname:
+            self._local_invalidate(self.key_make(keyname.strip()))
+        return ret_func
+
+    return wrapper_func
+
+
+# 释放锁，只删除自己持有的锁
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 增加计数，key 没有过期时间时(新建的 key)设置过期时间
+# KEYS[1]: key, ARGV[1]: 增加的值, ARGV[2]: 过期秒数，0 不设置
+INCR_WITH_TTL_SCRIPT = """
+local value = redis.call('incrby', KEYS[1], ARGV[1])
+if tonumber(ARGV[2]) > 0 and redis.call('ttl', KEYS[1]) == -1 then
+    redis.call('expire', KEYS[1], ARGV[2])
+end
+return value
+"""
+
+# 哈希表字段增加计数，超过上限时不修改，返回 nil
+# KEYS[1]: key, ARGV[1]: field, ARGV[2]: 增加的值, ARGV[3]: 上限, ARGV[4]: 过期秒数，0 不设置
+HINCR_CAPPED_SCRIPT = """
+local current = tonumber(redis.call('hget', KEYS[1], ARGV[1]) or 0)
+if current + tonumber(ARGV[2]) > tonumber(ARGV[3]) then
+    return false
+end
+local value = redis.call('hincrby', KEYS[1], ARGV[1], ARGV[2])
+if tonumber(ARGV[4]) > 0 and redis.call('ttl', KEYS[1]) == -1 then
+    redis.call('expire', KEYS[1], ARGV[4])
+end
+return value
+"""
+
+# 滑动窗口限流，有序集合记录窗口内每次请求的时间
+# KEYS[1]: key, ARGV[1]: 当前毫秒时间戳, ARGV[2]: 窗口毫秒数, ARGV[3]: 窗口内的最大次数, ARGV[4]: 本次请求的 member
+# 返回 {是否允许, 窗口内的次数}
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('zremrangebyscore', KEYS[1], '-inf', now - window)
+local count = redis.call('zcard', KEYS[1])
+if count >= tonumber(ARGV[3]) then
+    return {0, count}
+end
+redis.call('zadd', KEYS[1], now, ARGV[4])
+redis.call('pexpire', KEYS[1], window)
+return {1, count + 1}
+"""
+
+
+def chunks(items, size):
+    """
+    把 items 按 size 分批，批量命令分多次发送，避免单条命令过大阻塞 redis
+    """
+    items = list(items)
+    size = max(1, int(size))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def decode_value(result):
+    """
+    bytes to str， 空值返回 None
+    """
+    return None if not result else bytes.decode(result)
+
+
+def decode_list(result):
+    """
+    list 的每个元素 bytes to str， 空列表返回 None
+    """
+    if not result:
+        return None
+    return list(map(bytes.decode, result))
+
+
+def decode_set(result):
+    """
+    set 的每个元素 bytes to str， 空集合返回 None
+    """
+    if not result:
+        return None
+    return set(map(bytes.decode, result))
+
+
+def decode_dict(result):
+    """
+    dict 的 key 和 value bytes to str， 空字典返回 None
+    """
+    if not result:
+        return None
+    return dict(zip(map(bytes.decode, result.keys()), map(bytes.decode, result.values())))
+
+
+def decode_zset(result):
+    """
+    withscores 的有序集合结果 [(member, score)] 转为 {member: score}， 空结果返回 None
+    """
+    if not result:
+        return None
+    return {bytes.decode(field): score for field, score in result}
+
+
+def decode_batch_values(results):
+    """
+    分批 MGET/HMGET 的结果合并为一个列表， 每个值 bytes to str， 不存在的为 None
+    """
+    return [decode_value(v) for result in results for v in result]
+
+
+def decode_batch_ok(results):
+    """
+    分批写入的结果， HSET 返回新增字段的数量，每批都有返回即为成功， 返回 True
+    """
+    return all(result is not None for result in results)
+
+
+def decode_capped(result):
+    """
+    hIncrCapped 的结果， 超过上限时脚本返回 nil， 转为 False
+    """
+    return False if result is None else result
+
+
+def decode_rate_limit(result):
+    """
+    slidingWindowRateLimit 的结果 [1/0, 次数] 转为 (是否允许, 次数)
+    """
+    return bool(result[0]), result[1]
+
+
+# --------------------------------------------------------
+# decode_responses=True 时，客户端已经把结果解码为 str
+# 只需要保持和上面 decode_* 相同的返回结构
+# --------------------------------------------------------
+
+
+def native_value(result):
+    """
+    空值返回 None
+    """
+    return None if not result else result
+
+
+def native_collection(result):
+    """
+    list/set/dict 原样返回， 空结果返回 None
+    """
+    return None if not result else result
+
+
+def native_zset(result):
+    """
+    withscores 的有序集合结果 [(member, score)] 转为 {member: score}， 空结果返回 None
+    """
+    return None if not result else dict(result)
+
+
+def native_batch_values(results):
+    """
+    分批 MGET/HMGET 的结果合并为一个列表， 不存在的为 None
+    """
+    return [None if not v else v for result in results for v in result]
+
+
+# decode_* 对应 decode_responses=True 时使用的处理
+NATIVE_DECODERS = {
+    decode_value: native_value,
+    decode_list: native_collection,
+    decode_set: native_collection,
+    decode_dict: native_collection,
+    decode_zset: native_zset,
+    decode_batch_values: native_batch_values,
+}
+
+
+# --------------------------------------------------------
+# 设置了 codec 时，存储值使用 codec 解码
+# --------------------------------------------------------
+
+
+def codec_value(codec, result):
+    """
+    codec 解码， 不存在返回 None
+    """
+    return None if result is None else codec.loads(result)
+
+
+def codec_dict(codec, result):
+    """
+    dict 的 key bytes to str， value codec 解码， 空字典返回 None
+    """
+    if not result:
+        return None
+    return {bytes.decode(k): codec.loads(v) for k, v in result.items()}
+
+
+def codec_batch_values(codec, results):
+    """
+    分批 MGET/HMGET 的结果合并为一个列表， 每个值 codec 解码， 不存在的为 None
+    """
+    return [None if v is None else codec.loads(v) for result in results for v in result]
+
+
+# decode_* 对应设置了 codec 时使用的处理
+CODEC_DECODERS = {
+    decode_value: codec_value,
+    decode_dict: codec_dict,
+    decode_batch_values: codec_batch_values,
+}
+
+
+class ExpirePipeline:
+    """
+    命令代理， 把 key 的命令和 EXPIRE 放在同一个 pipeline 里发送
+    SET 直接使用 SET key value EX seconds，只发一条命令
+    一次网络往返完成 命令 + 设置过期时间
+    """
+
+    def __init__(self, obj_redis, keyname, expire):
+        self.obj_redis = obj_redis
+        self.keyname = keyname
+        self.expire = expire
+
+
+    def set(self, name, value, **kwargs):
+        """
+        SET key value EX seconds
+        """
+        kwargs.setdefault('ex', self.expire)
+        return self.obj_redis.set(name, value, **kwargs)
+
+
+    def __getattr__(self, command):
+        """
+        其他命令： pipeline 中依次放入 命令 和 EXPIRE，返回命令自身的结果
+        """
+        # 不存在的命令直接抛出 AttributeError
+        getattr(self.obj_redis, command)
+
+        def pipe_command(*args, **kwargs):
+            pipe = self.obj_redis.pipeline(transaction=False)
+            getattr(pipe, command)(*args, **kwargs)
+            pipe.expire(self.keyname, self.expire)
+            return pipe.execute()[0]
+
+        return pipe_command
+
+
 class LibRedis:
 
     # 默认所有key的前缀
@@ -40,18 +358,84 @@ class LibRedis:
     # 默认的过期时间为3天
     DEFAULT_EXPIRE = 259200;
 
+    # 过期时间随机增加的比例，0.1 为增加 0~10%，避免同时写入的 key 在同一秒过期
+    EXPIRE_JITTER = 0
+
+    # 读操作(hGet/hKeys/sMembers 等)是否刷新过期时间
+    touch_on_read = True
+
+    # 写操作和 EXPIRE 是否放在同一个 pipeline 中，一次网络往返
+    expire_in_pipeline = False
+
+    # 批量命令每批的最大 key/field 数量
+    BATCH_SIZE = 500
+
+    # 是否由客户端直接把结果解码为 str
+    decode_responses = False
+
+    # 存储值的编解码，见 lib_codec.Codec
+    codec = None
 
-    def __init__(self, host, port, db, prefix=None, charset='utf-8'):
+    # 进程内的 L1 缓存，见 lib_local_cache.LocalCache
+    # 只缓存 get/hGetAll 的结果，本实例的写操作会清除对应的 key
+    local_cache = None
+
+    # get/hGetAll 是否读 L1 缓存，pipeline 中不读
+    local_read = True
+
+    # Lua 脚本，{名称: 脚本}，见 register_script/run_script
+    LUA_SCRIPTS = {
+        'unlock': UNLOCK_SCRIPT,
+        'incr_with_ttl': INCR_WITH_TTL_SCRIPT,
+        'hincr_capped': HINCR_CAPPED_SCRIPT,
+        'sliding_window': SLIDING_WINDOW_SCRIPT,
+    }
+
+    # 脚本的 SHA1，{名称: sha}，所有实例共享
+    script_shas = dict()
+
+
+    def __init__(self, host, port, db, prefix=None, charset='utf-8', expire_in_pipeline=False,
+                 batch_size=None, connection_pool=None, decode_responses=False, codec=None,
+                 local_cache=None, expire_jitter=None, touch_on_read=True):
         """
         初始化
+        expire_in_pipeline: True 时，带默认过期时间的命令和 EXPIRE 一次发送
+        batch_size: 批量命令 mGet/mSet/hMGet/hMSet/mDelete 每批的数量
+        connection_pool: 共享连接池，见 lib_redis_pool.get_pool
+        decode_responses: True 时由客户端解码结果，不再逐个元素 bytes.decode
+            使用 connection_pool 时，连接池也要以 decode_responses=True 创建
+        codec: 存储值的序列化和压缩，lib_codec.Codec 实例
+            只作用于 set/get/mSet/mGet/hSet/hGet/hMSet/hMGet/hGetAll 的值
+            编码后是二进制数据，不能和 decode_responses 同时使用
+        local_cache: 进程内的 L1 缓存，lib_local_cache.LocalCache 实例
+        expire_jitter: 过期时间随机增加的比例，见 EXPIRE_JITTER
+        touch_on_read: False 时读操作不再发送 EXPIRE 刷新过期时间
+        带过期时间的方法调用时都可以传入 expire=秒数，expire=False 不修改过期时间
         """
         if not host or not port:
             return None
 
         if prefix:
            self.key_prefix = prefix.strip()
+
+        self.expire_in_pipeline = bool(expire_in_pipeline)
+        if batch_size:
+            self.BATCH_SIZE = int(batch_size)
+        self.decode_responses = bool(decode_responses)
+        if codec is not None and self.decode_responses:
+            raise ValueError('codec can not be used with decode_responses')
+        self.codec = codec
+        self.local_cache = local_cache
+        if expire_jitter is not None:
+            self.EXPIRE_JITTER = float(expire_jitter)
+        self.touch_on_read = bool(touch_on_read)
         # construct
-        self.obj_redis = StrictRedis(host=host, port=port, db=db, charset='utf-8')
+        if connection_pool is not None:
+            self.obj_redis = StrictRedis(connection_pool=connection_pool)
+        else:
+            self.obj_redis = StrictRedis(host=host, port=port, db=db, charset='utf-8',
+                                         decode_responses=self.decode_responses)
 
 
     def key_make(self, keyname=None):
@@ -65,14 +449,136 @@ class LibRedis:
         return self.key_prefix + str(keyname).strip()
 
 
-    def set_expire(self, keyname=None):
+    def pipeline(self, transaction=False):
+        """
+        pipeline，命令先缓存，一次网络往返发送
+        transaction=True 时使用 MULTI/EXEC 保证原子性
+        with obj_rd_window.pipeline() as p:
+            p.hSet('user', 'name', 'awe')
+            p.incrBy('count', 2)
+        print(p.results)
+        """
+        return LibRedisPipeline(self, transaction=transaction)
+
+
+    def _response(self, result, callback=None):
+        """
+        命令结果的处理，callback 负责 bytes to str 等解码
+        LibRedisPipeline 中 callback 延迟到 execute 时调用
+        """
+        if callback is None:
+            return result
+
+        return self._decoder(callback)(result)
+
+
+    def _decoder(self, callback):
+        """
+        decode_responses=True 时，使用不再 bytes.decode 的处理
+        """
+        if self.decode_responses:
+            return NATIVE_DECODERS.get(callback, callback)
+
+        return callback
+
+
+    def _local_invalidate(self, *keynames):
+        """
+        写操作之后清除 L1 缓存中的 key，keynames 已加前缀
+        """
+        if self.local_cache is not None:
+            self.local_cache.invalidate(*keynames)
+
+
+    def _value_dump(self, value):
+        """
+        存储值的处理， str 去掉首尾空白，设置了 codec 时再使用 codec 编码
+        """
+        if isinstance(value, str):
+            value = value.strip()
+        if self.codec is not None:
+            return self.codec.dumps(value)
+
+        return value
+
+
+    def _value_decoder(self, callback):
+        """
+        存储值的读取， 设置了 codec 时使用 codec 解码
+        """
+        if self.codec is None:
+            return callback
+
+        return functools.partial(CODEC_DECODERS[callback], self.codec)
+
+
+    @classmethod
+    def register_script(cls, name, script):
+        """
+        登记 Lua 脚本，之后用 run_script(name, keys, args) 执行
+        """
+        cls.LUA_SCRIPTS[name] = script
+        cls.script_shas.pop(name, None)
+
+
+    def script_sha(self, name):
+        """
+        脚本的 SHA1，本地计算，和 SCRIPT LOAD 返回的相同
+        """
+        sha = self.script_shas.get(name)
+        if sha is None:
+            sha = hashlib.sha1(self.LUA_SCRIPTS[name].encode('utf-8')).hexdigest()
+            self.script_shas[name] = sha
+        return sha
+
+
+    def run_script(self, name, keys=(), args=()):
+        """
+        执行登记的 Lua 脚本，脚本在 redis 中原子执行
+        EVALSHA 只发送 SHA1，redis 中没有该脚本(NOSCRIPT，如重启后)时 SCRIPT LOAD 后再执行
+        keys 需要已经加上前缀
+        """
+        sha = self.script_sha(name)
+        try:
+            return self.obj_redis.evalsha(sha, len(keys), *keys, *args)
+        except NoScriptError:
+            self.obj_redis.script_load(self.LUA_SCRIPTS[name])
+            return self.obj_redis.evalsha(sha, len(keys), *keys, *args)
+
+
+    def _pipeline(self):
+        """
+        批量命令内部使用的 pipeline
+        """
+        return self.obj_redis.pipeline(transaction=False)
+
+
+    def _pipeline_execute(self, pipe):
+        """
+        执行批量命令内部的 pipeline
+        """
+        return pipe.execute()
+
+
+    def expire_make(self, expire=None):
+        """
+        过期秒数，默认 DEFAULT_EXPIRE，加上 EXPIRE_JITTER 比例的随机秒数
+        """
+        expire = int(expire or self.DEFAULT_EXPIRE)
+        if self.EXPIRE_JITTER:
+            expire += random.randint(0, int(expire * self.EXPIRE_JITTER))
+        return expire
+
+
+    def set_expire(self, keyname=None, expire=None):
         """
         设置key的过期时间，装饰器调用
+        expire: 过期秒数，默认 DEFAULT_EXPIRE
         """
         if not keyname:
             return None
 
-        return self.obj_redis.expire(self.key_make(keyname), self.DEFAULT_EXPIRE)
+        return self.obj_redis.expire(self.key_make(keyname), self.expire_make(expire))
 
 
     # --------------------------------------------------------
@@ -80,6 +586,7 @@ class LibRedis:
     # --------------------------------------------------------
 
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def set(self, keyname=None, value=None):
         """
@@ -92,12 +599,29 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        if isinstance(value, str):
-            value = value.strip()
+        value = self._value_dump(value)
+
+        return self._response(self.obj_redis.set(keyname, value))
+
 
-        return self.obj_redis.set(keyname, value)
+    @wraps_local_invalidate
+    @wraps_set_expire
+    def setNx(self, keyname=None, value=None):
+        """
+        只有在 key 不存在时，设置 key 的值。
+        return：
+        设置成功返回 True， key 已存在返回 False
+        """
+        if not keyname or value is None:
+            return None
 
+        keyname = self.key_make(keyname.strip())
+        value = self._value_dump(value)
 
+        return self._response(self.obj_redis.setnx(keyname, value))
+
+
+    @wraps_local_cache
     def get(self, keyname=None):
         """
         获取指定 key 的值。
@@ -110,11 +634,11 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.get(keyname)
-
-        return None if not result else bytes.decode(result)
+        # bytes to str
+        return self._response(self.obj_redis.get(keyname), self._value_decoder(decode_value))
 
 
+    @wraps_local_invalidate
     def delete(self, keyname=None):
         """
         删除已存在的键。不存在的 key 会被忽略
@@ -125,9 +649,78 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.delete(keyname)
+        return self._response(self.obj_redis.delete(keyname))
+
+
+    def mGet(self, keynames=None):
+        """
+        批量获取多个 key 的值，每批一条 MGET
+        return：
+        和 keynames 顺序一致的值列表，不存在的 key 返回 None
+        """
+        if not keynames:
+            return None
+
+        results = list()
+        for batch in chunks(keynames, self.BATCH_SIZE):
+            results.append(self.obj_redis.mget([self.key_make(k) for k in batch]))
+
+        # bytes to str
+        return self._response(results, self._value_decoder(decode_batch_values))
+
 
+    def mSet(self, mapping=None, expire=None):
+        """
+        批量设置多个 key 的值，并设置默认过期时间
+        每批的 MSET 和 EXPIRE 放在同一个 pipeline 中，一批一次网络往返
+        mapping： {keyname1: value1, keyname2: value2}
+        expire： 过期秒数，每个 key 分别加上随机秒数；False 不修改过期时间
+        return：
+        全部设置成功返回 True
+        """
+        if not mapping or not isinstance(mapping, dict):
+            return None
+
+        results = list()
+        for batch in chunks(mapping.items(), self.BATCH_SIZE):
+            batch_dict = dict()
+            for k, v in batch:
+                if not k or v is None:
+                    continue
+                batch_dict[self.key_make(k)] = self._value_dump(v)
+            if not batch_dict:
+                continue
+
+            pipe = self._pipeline()
+            pipe.mset(batch_dict)
+            if expire is None or expire:
+                for k in batch_dict:
+                    pipe.expire(k, self.expire_make(expire))
+            results.extend(self._pipeline_execute(pipe))
+            self._local_invalidate(*batch_dict)
+
+        return self._response(results, all)
+
+
+    def mDelete(self, *keynames):
+        """
+        批量删除多个 key，每批一条 DEL。不存在的 key 会被忽略
+        return：
+        被删除 key 的数量
+        """
+        keynames = [self.key_make(k) for k in keynames if k]
+        if not keynames:
+            return None
 
+        results = list()
+        for batch in chunks(keynames, self.BATCH_SIZE):
+            results.append(self.obj_redis.delete(*batch))
+            self._local_invalidate(*batch)
+
+        return self._response(results, sum)
+
+
+    @wraps_local_invalidate
     @wraps_set_expire
     def append(self, keyname=None, value=None):
         """
@@ -148,9 +741,10 @@ class LibRedis:
         else:
             value = str(value)
 
-        return self.obj_redis.append(keyname, value)
+        return self._response(self.obj_redis.append(keyname, value))
 
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def incr(self, keyname=None, expire=None):
         """
@@ -165,9 +759,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.incr(keyname, 1)
+        return self._response(self.obj_redis.incr(keyname, 1))
 
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def incrBy(self, keyname=None, amount=1):
         """
@@ -188,9 +783,10 @@ class LibRedis:
         else:
             amount = 1
 
-        return self.obj_redis.incrby(keyname, amount)
+        return self._response(self.obj_redis.incrby(keyname, amount))
 
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def decr(self, keyname=None):
         """
@@ -205,9 +801,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.decr(keyname, 1)
+        return self._response(self.obj_redis.decr(keyname, 1))
 
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def decrBy(self, keyname=None, amount=1):
         """
@@ -221,7 +818,7 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         amount = int(amount)
-        return self.obj_redis.decr(keyname, amount)
+        return self._response(self.obj_redis.decr(keyname, amount))
 
 
     # --------------------------------------------------------
@@ -231,6 +828,7 @@ class LibRedis:
     # --------------------------------------------------------
     
 
+    @wraps_local_invalidate
     @wraps_set_expire
     def hSet(self, keyname=None, key=None, value=None):
         """
@@ -247,10 +845,11 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         key = key.strip()
-        return self.obj_redis.hset(keyname, key, value)
+        value = self._value_dump(value)
+        return self._response(self.obj_redis.hset(keyname, key, value))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def hGet(self, keyname=None, key=None):
         """
         获取存储在哈希表中指定字段的值
@@ -262,15 +861,11 @@ class LibRedis:
         keyname = self.key_make(keyname.strip())
         key = key.strip()
     
-        result = self.obj_redis.hget(keyname, key)
-        if not result:
-            return None
-        
         # bytes to str
-        return bytes.decode(result)
+        return self._response(self.obj_redis.hget(keyname, key), self._value_decoder(decode_value))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def hLen(self, keyname=None):
         """
         获取哈希表中字段的数量
@@ -280,10 +875,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.hlen(keyname)
+        return self._response(self.obj_redis.hlen(keyname))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def hKeys(self, keyname=None):
         """
         获取哈希表中的所有域（field）
@@ -294,19 +889,11 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.hkeys(keyname)
-        if not result:
-            return None
-
         # bytes to str
-        ret_list = list()
-        for v in result:
-            ret_list.append(bytes.decode(v))
+        return self._response(self.obj_redis.hkeys(keyname), decode_list)
 
-        return ret_list
 
-
-    @wraps_set_expire
+    @wraps_touch_expire
     def hVals(self, keyname=None):
         """
         哈希表所有域(field)的值
@@ -317,19 +904,12 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.hvals(keyname)
-        if not result:
-            return None
-
         # bytes to str
-        ret_list = list()
-        for v in result:
-            ret_list.append(bytes.decode(v))
-
-        return ret_list
+        return self._response(self.obj_redis.hvals(keyname), decode_list)
 
 
-    @wraps_set_expire
+    @wraps_local_cache
+    @wraps_touch_expire
     def hGetAll(self, keyname=None):
         """
         获取在哈希表中指定 keyname 的所有字段和值
@@ -341,16 +921,8 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.hgetall(keyname)
-        if not result:
-            return None
-
         # bytes to str
-        ret_dict = dict()
-        for k, v in result.items():
-            ret_dict[bytes.decode(k)] = bytes.decode(v)
-            
-        return ret_dict
+        return self._response(self.obj_redis.hgetall(keyname), self._value_decoder(decode_dict))
 
 
     def hExists(self, keyname=None, key=None):
@@ -363,9 +935,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.hexists(keyname, key)
+        return self._response(self.obj_redis.hexists(keyname, key))
 
 
+    @wraps_local_invalidate
     def hDel(self, keyname=None, *keys):
         """
         删除哈希表 key 中的一个或多个指定字段，不存在的字段将被忽略
@@ -377,7 +950,50 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.hdel(keyname, *keys)
+        return self._response(self.obj_redis.hdel(keyname, *keys))
+
+
+    @wraps_touch_expire
+    def hMGet(self, keyname=None, *keys):
+        """
+        获取哈希表中一个或多个字段的值，每批一条 HMGET
+        返回和 keys 顺序一致的值列表，不存在的字段返回 None
+        """
+        if not keyname or not keys:
+            return None
+
+        keyname = self.key_make(keyname.strip())
+
+        results = list()
+        for batch in chunks(keys, self.BATCH_SIZE):
+            results.append(self.obj_redis.hmget(keyname, batch))
+
+        # bytes to str
+        return self._response(results, self._value_decoder(decode_batch_values))
+
+
+    @wraps_local_invalidate
+    @wraps_set_expire
+    def hMSet(self, keyname=None, mapping=None):
+        """
+        同时将多个 field-value (域-值)对设置到哈希表中，每批一条多字段的 HSET
+        此命令会覆盖哈希表中已存在的字段。
+        如果哈希表不存在，会创建一个空哈希表，并执行 HSET 操作。
+        HMSET 在 redis-py 4.0 中已废弃，HSET key mapping 需要 redis-py >= 3.5、redis >= 4.0
+        mapping： {field1: value1, field2: value2}
+        全部设置成功返回 True
+        """
+        if not keyname or not mapping or not isinstance(mapping, dict):
+            return None
+
+        keyname = self.key_make(keyname.strip())
+
+        results = list()
+        for batch in chunks(mapping.items(), self.BATCH_SIZE):
+            batch = {k: self._value_dump(v) for k, v in batch}
+            results.append(self.obj_redis.hset(keyname, mapping=batch))
+
+        return self._response(results, decode_batch_ok)
 
 
     # --------------------------------------------------------
@@ -398,7 +1014,7 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.lpush(keyname, *values)
+        return self._response(self.obj_redis.lpush(keyname, *values))
 
     
     @wraps_set_expire
@@ -411,7 +1027,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.lpop(keyname)
+        return self._response(self.obj_redis.lpop(keyname))
 
 
     @wraps_set_expire
@@ -427,7 +1043,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.rpush(keyname, *values)
+        return self._response(self.obj_redis.rpush(keyname, *values))
 
     
     @wraps_set_expire
@@ -440,14 +1056,11 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.rpop(keyname)
-        if not result:
-            return None
         # bytes to str
-        return bytes.decode(result)
+        return self._response(self.obj_redis.rpop(keyname), decode_value)
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def lLen(self, keyname=None):
         """
         获取列表长度 
@@ -458,7 +1071,7 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.llen(keyname)
+        return self._response(self.obj_redis.llen(keyname))
     
     
     @wraps_set_expire
@@ -473,10 +1086,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.ltrim(keyname, start, end)
+        return self._response(self.obj_redis.ltrim(keyname, start, end))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def lGetRange(self, keyname=None, start=0, end=-1):
         """
         返回列表中指定区间内的元素，区间以偏移量 START 和 END 指定
@@ -488,15 +1101,8 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.lrange(keyname, start, end)
-        if not result:
-            return None
-        #bytes to str
-        ret_list = list()
-        for v in result:
-            ret_list.append(bytes.decode(v))
-
-        return ret_list
+        # bytes to str
+        return self._response(self.obj_redis.lrange(keyname, start, end), decode_list)
     
     
     @wraps_set_expire
@@ -513,7 +1119,7 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.lrem(keyname, count, value)
+        return self._response(self.obj_redis.lrem(keyname, count, value))
 
 
     # --------------------------------------------------------
@@ -535,10 +1141,10 @@ class LibRedis:
         if not keyname:
             return None
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.sadd(keyname, *values)
+        return self._response(self.obj_redis.sadd(keyname, *values))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def sCard(self, keyname=None):
         """
         获取集合key中元素的数量
@@ -547,7 +1153,7 @@ class LibRedis:
         if not keyname:
             return None
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.scard(keyname)
+        return self._response(self.obj_redis.scard(keyname))
 
 
     def sDiff(self, keyname=None, *keys):
@@ -568,16 +1174,8 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
 
-        result = self.obj_redis.sdiff(keyname, *other_keys)
-        if not result:
-            return None
-
         # bytes to str
-        ret_set = set()
-        for v in result:
-            ret_set.add(bytes.decode(v))
- 
-        return ret_set
+        return self._response(self.obj_redis.sdiff(keyname, *other_keys), decode_set)
 
 
     @wraps_set_expire
@@ -599,7 +1197,7 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
         
-        return self.obj_redis.sdiffstore(store_key, key, *other_keys)
+        return self._response(self.obj_redis.sdiffstore(store_key, key, *other_keys))
 
 
     def sInter(self, keyname=None, *keys):
@@ -617,16 +1215,8 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
 
-        result = self.obj_redis.sinter(keyname, *other_keys)
-        if not result:
-            return None
-
         # bytes to str
-        ret_set = set()
-        for v in result:
-            ret_set.add(bytes.decode(v))
-
-        return ret_set
+        return self._response(self.obj_redis.sinter(keyname, *other_keys), decode_set)
 
 
     @wraps_set_expire
@@ -647,7 +1237,7 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
 
-        return self.obj_redis.sinterstore(store_key, key, *other_keys)
+        return self._response(self.obj_redis.sinterstore(store_key, key, *other_keys))
 
 
     def sUnion(self, keyname=None, *keys):
@@ -666,16 +1256,8 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
 
-        result = self.obj_redis.sunion(keyname, *other_keys)
-        if not result:
-            return None
-
         # bytes to str
-        ret_set = set()
-        for v in result:
-            ret_set.add(bytes.decode(v))
-
-        return ret_set
+        return self._response(self.obj_redis.sunion(keyname, *other_keys), decode_set)
 
 
     @wraps_set_expire
@@ -696,10 +1278,10 @@ class LibRedis:
         for k in keys:
             other_keys.append(self.key_make(k))
 
-        return self.obj_redis.sunionstore(store_key, key, *other_keys)
+        return self._response(self.obj_redis.sunionstore(store_key, key, *other_keys))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def sIsMember(self, keyname=None, value=None):
         """
         判断成员元素是否是集合的成员
@@ -710,10 +1292,10 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.sismember(keyname, value)
+        return self._response(self.obj_redis.sismember(keyname, value))
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def sMembers(self, keyname=None):
         """
         返回集合中的所有的成员。 
@@ -723,16 +1305,8 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.smembers(keyname)
-        
-        if not result:
-            return None
         # bytes to str
-        ret_set = set()
-        for v in result:
-            ret_set.add(bytes.decode(v))
-            
-        return ret_set
+        return self._response(self.obj_redis.smembers(keyname), decode_set)
 
 
     @wraps_set_expire
@@ -748,7 +1322,7 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.srem(keyname, *values)
+        return self._response(self.obj_redis.srem(keyname, *values))
 
 
     @wraps_set_expire
@@ -762,13 +1336,11 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        result = self.obj_redis.spop(keyname)
-
         # bytes to str
-        return None if not result else bytes.decode(result)
+        return self._response(self.obj_redis.spop(keyname), decode_value)
 
 
-    @wraps_set_expire
+    @wraps_touch_expire
     def sRandMember(self, keyname=None, count=1):
         """
         返回集合中的随机元素，而不对集合进行任何改动
@@ -790,17 +1362,8 @@ class LibRedis:
         else:
             count = 1
         
-        result = self.obj_redis.srandmember(keyname, count)
-        
-        if not result:
-            return None
-        
         # bytes to str
-        ret_list = list()
-        for v in result:
-            ret_list.append(bytes.decode(v))
-            
-        return ret_list
+        return self._response(self.obj_redis.srandmember(keyname, count), decode_list)
 
 
     # --------------------------------------------------------
@@ -828,7 +1391,7 @@ class LibRedis:
             return None
         
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zadd(keyname, **kwargs)
+        return self._response(self.obj_redis.zadd(keyname, **kwargs))
 
 
     def zRangeByScore(self, keyname=None, min=None, max=None, withscores=False):
@@ -845,24 +1408,8 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         result = self.obj_redis.zrangebyscore(keyname, min, max, withscores=withscores)
-        
-        if not result:
-            return None
-        
-        # bytes to str
-        if not withscores:
-            # return list
-            zret = list()
-            for field in result:
-                zret.append(bytes.decode(field))
-        else:
-            # return dict
-            zret = list()
-            for field,score in result:
-                zret.append((bytes.decode(field), score))
-            zret =dict(zret)
-            
-        return zret
+        # bytes to str， withscores 时返回 dict
+        return self._response(result, decode_zset if withscores else decode_list)
         
 
     def zRevRangeByScore(self, keyname=None, max=None, min=None, withscores=False):
@@ -879,24 +1426,8 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         result = self.obj_redis.zrevrangebyscore(keyname, max, min, withscores=withscores)
-
-        if not result:
-            return None
-
-        # bytes to str
-        if not withscores:
-            # return list
-            zret = list()
-            for field in result:
-                zret.append(bytes.decode(field))
-        else:
-            # return dict
-            zret = list()
-            for field,score in result:
-                zret.append((bytes.decode(field), score))
-            zret =dict(zret)
-            
-        return zret
+        # bytes to str， withscores 时返回 dict
+        return self._response(result, decode_zset if withscores else decode_list)
 
 
     def zRank(self, keyname=None, member=None):
@@ -911,7 +1442,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zrank(keyname, member)
+        return self._response(self.obj_redis.zrank(keyname, member))
 
 
     def zRevRank(self, keyname=None, member=None):
@@ -926,7 +1457,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zrevrank(keyname, member)
+        return self._response(self.obj_redis.zrevrank(keyname, member))
 
 
     def zRange(self, keyname=None, start=None, end=None, withscores=False):
@@ -942,24 +1473,8 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         result = self.obj_redis.zrange(keyname, start, end, withscores=withscores)
-
-        if not result:
-            return None
-
-        # bytes to str
-        if not withscores:
-            # return list
-            zret = list()
-            for field in result:
-                zret.append(bytes.decode(field))
-        else:
-            # return dict
-            zret = list()
-            for field,score in result:
-                zret.append((bytes.decode(field), score))
-            zret =dict(zret)
-            
-        return zret
+        # bytes to str， withscores 时返回 dict
+        return self._response(result, decode_zset if withscores else decode_list)
 
 
     def zRevrange(self, keyname=None, start=None, end=None, withscores=False):
@@ -975,24 +1490,8 @@ class LibRedis:
 
         keyname = self.key_make(keyname.strip())
         result = self.obj_redis.zrevrange(keyname, start, end, withscores=withscores)
-
-        if not result:
-            return None
-
-        # bytes to str
-        if not withscores:
-            # return list
-            zret = list()
-            for field in result:
-                zret.append(bytes.decode(field))
-        else:
-            # return dict
-            zret = list()
-            for field,score in result:
-                zret.append((bytes.decode(field), score))
-            zret =dict(zret)
-            
-        return zret
+        # bytes to str， withscores 时返回 dict
+        return self._response(result, decode_zset if withscores else decode_list)
 
 
     def zRem(self, keyname, *member):
@@ -1006,7 +1505,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zrem(keyname, *member)
+        return self._response(self.obj_redis.zrem(keyname, *member))
 
 
     def zRemRangeByRank(self, keyname=None, min=None, max=None):
@@ -1019,7 +1518,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zremrangebyrank(keyname, min, max)
+        return self._response(self.obj_redis.zremrangebyrank(keyname, min, max))
 
 
     def zRemrangebyscore(self, keyname=None, min=None, max=None):
@@ -1032,7 +1531,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zremrangebyscore(keyname, min, max)
+        return self._response(self.obj_redis.zremrangebyscore(keyname, min, max))
 
 
     def zCard(self, keyname=None):
@@ -1045,7 +1544,7 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zcard(keyname)
+        return self._response(self.obj_redis.zcard(keyname))
 
 
     def zCount(self, keyname=None, min=None, max=None):
@@ -1057,4 +1556,342 @@ class LibRedis:
             return None
 
         keyname = self.key_make(keyname.strip())
-        return self.obj_redis.zcount(keyname, min, max)
+        return self._response(self.obj_redis.zcount(keyname, min, max))
+
+
+    # --------------------------------------------------------
+    # Scan 游标迭代
+    # 分多次 SCAN/HSCAN/SSCAN/ZSCAN 取回，每次只取一小批，不会长时间阻塞 redis
+    # 只需要遍历的地方代替 hGetAll/sMembers/hKeys/zRange(0, -1) 一次取回全部
+    # count 是每次取回数量的提示值，redis 不保证严格按照 count 返回
+    # 遍历过程中集合有修改时，元素可能重复返回
+    # --------------------------------------------------------
+
+
+    def _decode_item(self, value):
+        """
+        单个元素 bytes to str
+        """
+        if self.decode_responses or not isinstance(value, bytes):
+            return value
+
+        return bytes.decode(value)
+
+
+    def scanIter(self, match=None, count=None):
+        """
+        遍历当前 db 中前缀为 key_prefix 的 key
+        match： 不含前缀的匹配模式，默认为 *
+        yield 去掉前缀的 keyname
+        """
+        match = self.key_prefix + (str(match).strip() if match else '*')
+        prefix_len = len(self.key_prefix)
+
+        for key in self.obj_redis.scan_iter(match=match, count=count):
+            yield self._decode_item(key)[prefix_len:]
+
+
+    def hScanIter(self, keyname=None, match=None, count=None):
+        """
+        遍历哈希表的字段和值
+        yield (field, value)
+        """
+        if not keyname:
+            return
+
+        keyname = self.key_make(keyname.strip())
+        for field, value in self.obj_redis.hscan_iter(keyname, match=match, count=count):
+            yield self._decode_item(field), self._decode_item(value)
+
+
+    def sScanIter(self, keyname=None, match=None, count=None):
+        """
+        遍历集合的成员
+        yield member
+        """
+        if not keyname:
+            return
+
+        keyname = self.key_make(keyname.strip())
+        for member in self.obj_redis.sscan_iter(keyname, match=match, count=count):
+            yield self._decode_item(member)
+
+
+    def zScanIter(self, keyname=None, match=None, count=None):
+        """
+        遍历有序集合的成员和分数，不保证按分数排序
+        yield (member, score)
+        """
+        if not keyname:
+            return
+
+        keyname = self.key_make(keyname.strip())
+        for member, score in self.obj_redis.zscan_iter(keyname, match=match, count=count):
+            yield self._decode_item(member), score
+
+
+    # --------------------------------------------------------
+    # Lua 脚本实现的组合操作，原子执行，一次网络往返
+    # --------------------------------------------------------
+
+
+    @wraps_local_invalidate
+    def incrWithTtl(self, keyname=None, amount=1, expire=None):
+        """
+        将 keyname 中储存的数字值增加 amount，key 没有过期时间时(新建的 key)设置过期时间
+        已有的过期时间不会被刷新，适合固定时间窗口的计数
+        expire: 过期秒数，默认 DEFAULT_EXPIRE，expire=False 不设置
+        return：
+        增加之后 key 的值
+        """
+        if not keyname:
+            return None
+
+        keyname = self.key_make(keyname.strip())
+        expire = 0 if expire is not None and not expire else self.expire_make(expire)
+        return self._response(self.run_script('incr_with_ttl', [keyname], [int(amount), expire]))
+
+
+    @wraps_local_invalidate
+    def hIncrCapped(self, keyname=None, field=None, amount=1, cap=None, expire=None):
+        """
+        哈希表 keyname 中的字段 field 的值增加 amount，增加后超过 cap 时不修改
+        key 没有过期时间时设置过期时间，expire=False 不设置
+        cap: 上限，增加之后的值最大为 cap
+        return：
+        增加之后字段的值，超过上限返回 False
+        """
+        if not keyname or field is None or cap is None:
+            return None
+
+        keyname = self.key_make(keyname.strip())
+        expire = 0 if expire is not None and not expire else self.expire_make(expire)
+        return self._response(self.run_script('hincr_capped', [keyname],
+                                              [field, int(amount), int(cap), expire]),
+                              decode_capped)
+
+
+    def slidingWindowRateLimit(self, keyname=None, limit=None, window=60):
+        """
+        滑动窗口限流，最近 window 秒内最多允许 limit 次
+        有序集合记录窗口内允许的每次请求，被拒绝的请求不记录
+        时间取本机时间，各服务器的时钟需要同步
+        window: 窗口秒数，可以是小数
+        return：
+        (是否允许, 窗口内的次数)
+        """
+        if not keyname or not limit or not window:
+            return None
+
+        keyname = self.key_make(keyname.strip())
+        now = int(time.time() * 1000)
+        member = '%s-%s' % (now, uuid.uuid4().hex[:8])
+        return self._response(self.run_script('sliding_window', [keyname],
+                                              [now, int(window * 1000), int(limit), member]),
+                              decode_rate_limit)
+
+
+    # --------------------------------------------------------
+    # 缓存击穿保护，见 lib_stampede
+    # 不能在 pipeline 中使用
+    # --------------------------------------------------------
+
+
+    def _envelope_dump(self, envelope):
+        """
+        get_or_compute 缓存的内容，设置了 codec 时使用 codec，否则 json
+        """
+        if self.codec is not None:
+            return self.codec.dumps(envelope)
+
+        return json.dumps(envelope)
+
+
+    def _envelope_load(self, value):
+        if value is None:
+            return None
+
+        if self.codec is not None:
+            return self.codec.loads(value)
+
+        return json.loads(value)
+
+
+    def get_or_compute(self, keyname=None, fn=None, ttl=None, beta=1.0, lock_timeout=10,
+                       wait=0.5, stale_ttl=300):
+        """
+        读取缓存，不存在或需要刷新时调用 fn() 计算并缓存
+        只有抢到锁(SET NX EX)的进程计算，其他进程返回旧值，没有旧值时最多等待 wait 秒
+        XFetch 提前刷新，过期时间被随机打散
+        ttl: 逻辑过期秒数，默认 DEFAULT_EXPIRE
+        beta: 提前刷新的倾向，0 只在逻辑过期后刷新
+        lock_timeout: 锁的秒数，应大于 fn() 的耗时
+        stale_ttl: 逻辑过期后旧值再保留的秒数，刷新期间返回旧值
+        return：
+        fn() 的返回值，没有设置 codec 时需要可以 json 序列化
+        """
+        if not keyname or fn is None:
+            return None
+
+        keyname = self.key_make(keyname.strip())
+        lock_key = keyname + ':lock'
+        ttl = int(ttl or self.DEFAULT_EXPIRE)
+
+        def load():
+            return self._envelope_load(self.obj_redis.get(keyname))
+
+        def store(envelope):
+            self.obj_redis.set(keyname, self._envelope_dump(envelope), ex=ttl + int(stale_ttl))
+
+        def lock():
+            token = uuid.uuid4().hex
+            return token if self.obj_redis.set(lock_key, token, nx=True, ex=lock_timeout) else None
+
+        def unlock(token):
+            self.run_script('unlock', [lock_key], [token])
+
+        return lib_stampede.get_or_compute(load, store, lock, unlock, fn, ttl, beta=beta, wait=wait)
+
+
+class LibRedisPipeline(LibRedis):
+    """
+    LibRedis 的 pipeline/事务
+    和 LibRedis 相同的接口和参数处理，命令先缓存到 pipeline 中
+    退出 with 或调用 execute 时一次网络往返发送，按调用顺序返回解码后的结果
+    参数不合法（返回 None）的调用不会放入 pipeline，也没有对应的结果
+    """
+
+    # pipeline 中 EXPIRE 已经和命令一起发送
+    expire_in_pipeline = False
+
+    # 命令在 execute 时才有结果，不读 L1 缓存；写操作在 execute 之后清除 L1 中的 key
+    local_read = False
+
+
+    def __init__(self, obj_lib, transaction=False):
+        """
+        初始化，沿用 obj_lib 的前缀、过期时间等配置
+        transaction: True 时使用 MULTI/EXEC
+        """
+        self.__dict__.update(obj_lib.__dict__)
+        self.expire_in_pipeline = False
+        self.obj_redis = obj_lib.obj_redis.pipeline(transaction=transaction)
+        # [(命令数量, 是否批量, callback, 是否返回结果)]
+        self.callbacks = list()
+        self.results = None
+        # 已登记的命令数量
+        self.command_mark = 0
+        # execute 之后要清除的 L1 缓存中的 key
+        self.invalidate_keys = list()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        self.reset()
+
+
+    def _record(self, is_batch, callback, keep):
+        """
+        登记上一次登记之后放入 pipeline 的命令
+        """
+        command_count = len(self.obj_redis) - self.command_mark
+        self.command_mark = len(self.obj_redis)
+        self.callbacks.append((command_count, is_batch, callback, keep))
+
+
+    def _response(self, result, callback=None):
+        """
+        命令已放入 pipeline，登记解码 callback，execute 时再处理
+        批量方法传入 list，callback 接收这些命令的结果列表
+        """
+        if callback is not None:
+            callback = self._decoder(callback)
+        self._record(isinstance(result, list), callback, True)
+        return self
+
+
+    def _pipeline(self):
+        """
+        批量命令直接放入当前 pipeline
+        """
+        return self.obj_redis
+
+
+    def _pipeline_execute(self, pipe):
+        """
+        当前 pipeline 在 execute 时统一执行
+        """
+        return list()
+
+
+    def _local_invalidate(self, *keynames):
+        """
+        命令在 execute 时才写入，先记下 key，execute 之后再清除
+        放入 pipeline 时就清除的话，execute 之前并发的读取会把旧值重新放入 L1
+        """
+        if self.local_cache is not None:
+            self.invalidate_keys.extend(keynames)
+
+
+    def run_script(self, name, keys=(), args=()):
+        """
+        pipeline 中执行时无法处理 NOSCRIPT，使用 EVAL 发送完整的脚本
+        """
+        return self.obj_redis.eval(self.LUA_SCRIPTS[name], len(keys), *keys, *args)
+
+
+    def set_expire(self, keyname=None, expire=None):
+        """
+        EXPIRE 放入 pipeline，结果不返回
+        """
+        if not keyname:
+            return None
+
+        self.obj_redis.expire(self.key_make(keyname), self.expire_make(expire))
+        self._record(False, None, False)
+        return self
+
+
+    def execute(self):
+        """
+        发送 pipeline 中的全部命令
+        return：
+        按调用顺序，解码后的结果列表
+        """
+        try:
+            raw_results = self.obj_redis.execute()
+        finally:
+            # 执行出错时部分命令可能已经写入，同样清除
+            keynames, self.invalidate_keys = self.invalidate_keys, list()
+            LibRedis._local_invalidate(self, *keynames)
+
+        self.results = list()
+        offset = 0
+        for command_count, is_batch, callback, keep in self.callbacks:
+            if is_batch:
+                result = raw_results[offset:offset + command_count]
+            else:
+                result = raw_results[offset]
+            offset += command_count
+
+            if keep:
+                self.results.append(result if callback is None else callback(result))
+
+        self.callbacks = list()
+        self.command_mark = 0
+        return self.results
+
+
+    def reset(self):
+        """
+        清空 pipeline 中未发送的命令
+        """
+        self.obj_redis.reset()
+        self.callbacks = list()
+        self.command_mark = 0
+        self.invalidate_keys = list()
@@ -0,0 +1,127 @@
+"""
+Redis 连接池注册表
+
+同一个 host:port 的所有 db 共享一个有界的连接池，
+避免每个 LibRedis 实例各自创建连接池，一个 worker 打开成倍的 socket。
+连接从共享池取出时，如果连接当前所在的 db 不同，先 SELECT 切换。
+"""
+import threading
+from redis import BlockingConnectionPool
+
+
+class SharedConnectionPool(BlockingConnectionPool):
+    """
+    host:port 共享的有界连接池
+    连接数达到 max_connections 后，最多等待 timeout 秒获取空闲连接
+    """
+
+    def stats(self):
+        """
+        连接池统计
+        created: 已创建的连接数
+        in_use: 使用中的连接数
+        idle: 空闲的连接数
+        """
+        created = len(self._connections)
+        idle = len([conn for conn in list(self.pool.queue) if conn])
+        return dict(
+            max_connections=self.max_connections,
+            created=created,
+            in_use=created - idle,
+            idle=idle,
+        )
+
+
+class DbConnectionPool:
+    """
+    共享连接池中某个 db 的视图，作为 StrictRedis 的 connection_pool 使用
+    """
+
+    def __init__(self, shared_pool, db=0):
+        self.shared_pool = shared_pool
+        self.db = int(db or 0)
+
+
+    @property
+    def connection_kwargs(self):
+        """
+        连接参数，db 为当前视图的 db
+        """
+        connection_kwargs = dict(self.shared_pool.connection_kwargs)
+        connection_kwargs['db'] = self.db
+        return connection_kwargs
+
+
+    def get_connection(self, *args, **kwargs):
+        """
+        从共享池取出连接，切换到当前视图的 db
+        未建立 socket 的连接直接修改 db，连接时 SELECT
+        """
+        connection = self.shared_pool.get_connection(*args, **kwargs)
+        if connection.db == self.db:
+            return connection
+
+        try:
+            if connection._sock is not None:
+                connection.send_command('SELECT', self.db)
+                connection.read_response()
+            connection.db = self.db
+        except Exception:
+            self.shared_pool.release(connection)
+            raise
+
+        return connection
+
+
+    def release(self, connection):
+        """
+        连接放回共享池
+        """
+        self.shared_pool.release(connection)
+
+
+    def __getattr__(self, name):
+        """
+        其他属性和方法使用共享池的
+        """
+        return getattr(self.shared_pool, name)
+
+
+    def __repr__(self):
+        return '%s<%r db=%s>' % (type(self).__name__, self.shared_pool, self.db)
+
+
+# {'host:port': SharedConnectionPool}
+_shared_pools = dict()
+_shared_pools_lock = threading.Lock()
+
+
+def get_pool(host, port, db=0, **options):
+    """
+    获取 host:port 共享连接池中 db 的视图
+    options 只在第一次创建共享池时生效：
+        max_connections, timeout, socket_timeout, socket_connect_timeout, health_check_interval ...
+    decode_responses 的连接和普通连接不能混用，分别共享连接池
+    """
+    pool_key = '%s:%s' % (host, port)
+    if options.get('decode_responses'):
+        pool_key += '/decode'
+    with _shared_pools_lock:
+        shared_pool = _shared_pools.get(pool_key)
+        if shared_pool is None:
+            shared_pool = SharedConnectionPool(host=host, port=port, **options)
+            _shared_pools[pool_key] = shared_pool
+
+    return DbConnectionPool(shared_pool, db)
+
+
+def pool_stats():
+    """
+    所有共享连接池的统计，用于监控
+    return：
+    {'host:port': {'max_connections': , 'created': , 'in_use': , 'idle': }}
+    """
+    with _shared_pools_lock:
+        shared_pools = dict(_shared_pools)
+
+    return {pool_key: pool.stats() for pool_key, pool in shared_pools.items()}
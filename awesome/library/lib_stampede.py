@@ -0,0 +1,84 @@
+"""
+缓存击穿保护
+
+热点 key 过期的瞬间，所有 worker 同时未命中，同时回源查库。
+1. 单飞(single-flight)： 重新计算前先抢一个短时间的锁，只有抢到锁的进程计算，
+   其他进程返回旧值；没有旧值时短暂等待计算结果。
+2. 提前刷新(XFetch)： 缓存值带上计算耗时 delta 和逻辑过期时间 expiry，
+   每次读取时以 now - delta * beta * log(rand()) >= expiry 的概率提前刷新，
+   越接近过期、计算越慢，提前刷新的概率越大，过期时间被随机打散。
+   https://cseweb.ucsd.edu/~avattani/papers/cache_stampede.pdf
+
+LibRedis.get_or_compute 和 LibMemcached.get_or_compute 提供存储和锁，流程在这里。
+"""
+import math
+import random
+import time
+
+
+def make_envelope(value, delta, ttl):
+    """
+    缓存的内容
+    v: 值, d: 计算耗时秒数, e: 逻辑过期的时间戳
+    """
+    return dict(v=value, d=delta, e=time.time() + ttl)
+
+
+def is_fresh(envelope, beta=1.0):
+    """
+    XFetch，是否不需要刷新
+    beta > 1 更倾向于提前刷新，beta = 0 只在逻辑过期后刷新
+    """
+    # 1 - random() 的范围是 (0, 1]，log 不会出错
+    early = envelope['d'] * beta * -math.log(1.0 - random.random())
+    return time.time() + early < envelope['e']
+
+
+def compute(fn, store, ttl):
+    """
+    计算并写入缓存，记录计算耗时
+    """
+    start = time.time()
+    value = fn()
+    store(make_envelope(value, time.time() - start, ttl))
+    return value
+
+
+def get_or_compute(load, store, lock, unlock, fn, ttl, beta=1.0, wait=0.5, wait_interval=0.05):
+    """
+    load(): 读取缓存，返回 envelope 或 None
+    store(envelope): 写入缓存
+    lock(): 抢锁，成功返回 token，失败返回 None
+    unlock(token): 释放锁
+    fn(): 计算值
+    ttl: 逻辑过期秒数
+    wait: 没有旧值且没抢到锁时，等待计算结果的最长秒数，超时后自己计算
+    """
+    envelope = load()
+    if envelope is not None and is_fresh(envelope, beta):
+        return envelope['v']
+
+    token = lock()
+    if token:
+        try:
+            if envelope is None:
+                # 抢锁之前其他进程可能刚刚写入
+                envelope = load()
+                if envelope is not None and time.time() < envelope['e']:
+                    return envelope['v']
+            return compute(fn, store, ttl)
+        finally:
+            unlock(token)
+
+    # 其他进程正在计算，返回旧值
+    if envelope is not None:
+        return envelope['v']
+
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(wait_interval)
+        envelope = load()
+        if envelope is not None:
+            return envelope['v']
+
+    return compute(fn, store, ttl)
@@ -1,11 +1,53 @@
 """
 Memcached 的实例化
+实例延迟创建，第一次使用时才导入 memcache 和创建客户端
 """
+from django.utils.functional import SimpleLazyObject
 from awesome.config import memcached
-from awesome.library.lib_memcached import LibMemcached
 
 
-one = LibMemcached(
-                        host=memcached.mem_one[0],
-                        port=memcached.mem_one[1],
-                    )
\ No newline at end of file
+def make_memcached(conf, **kwargs):
+    """
+    根据配置 [host, port] 实例化 LibMemcached
+    """
+    from awesome.library.lib_memcached import LibMemcached
+
+    kwargs.setdefault('expire_jitter', memcached.mem_expire_jitter)
+    return LibMemcached(
+                            host=conf[0],
+                            port=conf[1],
+                            **kwargs
+                        )
+
+
+def make_memcached_cluster(servers, **kwargs):
+    """
+    根据多节点配置 [[host, port, weight], ...] 实例化 LibMemcached，一致性哈希分布 key
+    """
+    from awesome.library.lib_memcached import LibMemcached
+
+    kwargs.setdefault('expire_jitter', memcached.mem_expire_jitter)
+    return LibMemcached(servers=servers, **kwargs)
+
+
+def make_local_cache(name):
+    """
+    配置了 mem_local_cache 时，进程内的 L1 缓存
+    """
+    from awesome.library.lib_local_cache import make_local_cache
+
+    if not memcached.mem_local_cache:
+        return None
+
+    obj_redis = None
+    if memcached.mem_local_cache.get('channel'):
+        from awesome.loader import loader_redis
+        obj_redis = loader_redis.obj_rd_one.obj_redis
+    return make_local_cache(name, memcached.mem_local_cache, obj_redis)
+
+
+one = SimpleLazyObject(lambda: make_memcached(memcached.mem_one,
+                                              local_cache=make_local_cache('memcached_one')))
+
+cluster = SimpleLazyObject(lambda: make_memcached_cluster(memcached.mem_cluster,
+                                                          local_cache=make_local_cache('memcached_cluster')))
@@ -1,33 +1,39 @@
 """
 redis 的实例化
+同一个 host:port 的实例共享连接池
+实例延迟创建，第一次使用时才导入 redis 和建立连接池
 """
-from awesome.library.lib_redis import LibRedis
+from django.utils.functional import SimpleLazyObject
 from awesome.config import redis
 
 
-obj_rd_window = LibRedis(
-                            host=redis.rd_window[0],
-                            port=redis.rd_window[1],
-                            db=redis.rd_window[2],
-                            prefix = 'window_'
-                        )
+def make_redis(conf, **kwargs):
+    """
+    根据配置 [host, port, db] 实例化 LibRedis
+    配置了 rd_local_cache 时，每个实例带一个进程内的 L1 缓存
+    rd_expire 为过期时间的默认参数，kwargs 可以覆盖
+    """
+    from awesome.library.lib_redis import LibRedis
+    from awesome.library.lib_redis_pool import get_pool
+    from awesome.library.lib_local_cache import make_local_cache
 
-obj_rd_one = LibRedis(
-                            host=redis.rd_one[0],
-                            port=redis.rd_one[1],
-                            db=redis.rd_one[2]
-                        )
+    obj_redis = LibRedis(
+                        host=conf[0],
+                        port=conf[1],
+                        db=conf[2],
+                        connection_pool=get_pool(*conf, **redis.rd_pool),
+                        **dict(redis.rd_expire, **kwargs)
+                    )
+    if 'local_cache' not in kwargs:
+        obj_redis.local_cache = make_local_cache('redis_%s_%s_%s' % tuple(conf),
+                                                 redis.rd_local_cache, obj_redis.obj_redis)
+    return obj_redis
 
-obj_rd_two = LibRedis(
-                            host=redis.rd_two[0],
-                            port=redis.rd_two[1],
-                            db=redis.rd_two[2]
-                        )
 
-obj_rd_three = LibRedis(
-                            host=redis.rd_three[0],
-                            port=redis.rd_three[1],
-                            db=redis.rd_three[2]
-                        )
+obj_rd_window = SimpleLazyObject(lambda: make_redis(redis.rd_window, prefix='window_'))
 
+obj_rd_one = SimpleLazyObject(lambda: make_redis(redis.rd_one))
 
+obj_rd_two = SimpleLazyObject(lambda: make_redis(redis.rd_two))
+
+obj_rd_three = SimpleLazyObject(lambda: make_redis(redis.rd_three))
@@ -83,6 +83,10 @@ DATABASE_ROUTERS = [
     'awesome.config.mysql.DBRouterApp',
 ]
 
+# UID 分配方式
+# segment: 数据库号段， redis: Redis INCRBY 号段， insert: 每个UID写入一行
+UID_BACKEND = 'segment'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -20,5 +20,7 @@ from awesome import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('awe', views.index),
+    path('awe/redis_pool', views.redis_pool),
+    path('awe/local_cache', views.local_cache),
     path('application/', include('application.urls')),
 ]
@@ -11,4 +11,20 @@ def index(request):
     str = 'awesome %s ' % request.path
     str += 'config-myapps:%s ' % myapps.MY_APPS
     str += 'loader-memcache:%s ' % xx_cache
-    return HttpResponse(str)
\ No newline at end of file
+    return HttpResponse(str)
+
+def redis_pool(request):
+    """
+    redis 共享连接池的统计，用于监控
+    """
+    from django.http import JsonResponse
+    from awesome.library.lib_redis_pool import pool_stats
+    return JsonResponse(pool_stats())
+
+def local_cache(request):
+    """
+    进程内 L1 缓存的命中率等统计，用于监控
+    """
+    from django.http import JsonResponse
+    from awesome.library.lib_local_cache import local_cache_stats
+    return JsonResponse(local_cache_stats())